@@ -94,6 +94,29 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# LocMemCache lives inside one process. The catalog cache invalidates by
+# bumping tag versions in this cache (see products/cache.py), so with
+# several workers (gunicorn -w N, uwsgi processes) an edit is only seen by
+# the worker that handled it, and the others keep serving stale responses
+# for up to CATALOG_CACHE_TIMEOUT. Multi-worker deployments need a backend
+# shared by every worker, e.g. on a single host:
+#     'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#     'LOCATION': BASE_DIR / 'cache',
+# or across hosts (needs the redis package):
+#     'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#     'LOCATION': 'redis://127.0.0.1:6379/1',
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pcmarket',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -175,6 +198,11 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        # orjson-backed, falls back to the stdlib encoder (see backend/renderers.py)
+        'backend.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
 }
@@ -192,3 +220,40 @@ SIMPLE_JWT = {
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Uploads are stored once per content under MEDIA_ROOT/cas/, named by their
+# hash, and served with a far-future Cache-Control (see products/storage.py)
+STORAGES = {
+    'default': {'BACKEND': 'products.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Catalog
+# Serve product_categories from the CategoryProductCount table (maintained on
+# Product save/delete only while this is on) instead of aggregating the
+# products table per request. After turning it on, run
+# products.signals.recount_category_products() once
+PRODUCT_CATEGORY_COUNTERS = False
+
+# Tagged response cache for the catalog endpoints (see products/cache.py)
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+# Keep a serialized snapshot of each active product, invalidated on edit
+PRODUCT_DETAIL_SNAPSHOTS = True
+
+# Upper edges of the price ranges counted by the facets endpoint
+PRODUCT_PRICE_BUCKETS = [10000, 25000, 50000, 100000, 200000]
+
+# Responsive image derivatives (see products/images.py): widths in px and
+# formats rendered for every product and category image
+IMAGE_DERIVATIVE_WIDTHS = [320, 640, 960]
+IMAGE_DERIVATIVE_FORMATS = ['webp', 'jpeg']
+# Render them in a background thread pool after the save commits
+IMAGE_DERIVATIVES_BACKGROUND = True
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Orders
+# Accept order items without a product_id (free-text name and price, no stock
+# reservation). Off: every item must reference a catalog product, whose
+# current price is charged
+ORDER_FREE_TEXT_ITEMS = False
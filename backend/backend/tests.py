@@ -0,0 +1,274 @@
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+
+import download_real_images
+from download_real_images import ImageDownloader, download_all_images
+from . import renderers
+from .renderers import FastJSONRenderer
+
+# Everything both encoders support, without bare Decimals (DRF turns those into floats)
+DOCUMENT = {
+    'id': 1,
+    'name': 'Ноутбук "Pro" 15″',
+    'price': '1000.00',
+    'rating': 4.5,
+    'in_stock': True,
+    'image': None,
+    'tags': ['a', 'b'],
+    'created_at': datetime.datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc),
+    'release_date': datetime.date(2024, 1, 2),
+    'uid': uuid.UUID(int=1),
+    'specs': {'CPU': 'Intel', 'RAM': '16 GB'},
+}
+
+
+class FastJSONRendererTests(SimpleTestCase):
+
+    def render(self, data, media_type='application/json'):
+        return FastJSONRenderer().render(data, media_type)
+
+    def drf_render(self, data, media_type='application/json'):
+        return JSONRenderer().render(data, media_type)
+
+    def test_same_bytes_as_drf(self):
+        self.assertEqual(self.render(DOCUMENT), self.drf_render(DOCUMENT))
+        self.assertEqual(self.render([]), b'[]')
+        self.assertEqual(self.render(None), b'')
+
+    def test_decimal_rendered_as_string(self):
+        data = {'total': Decimal('2250.50'), 'lines': [Decimal('0.10')]}
+        self.assertEqual(json.loads(self.render(data)), {'total': '2250.50', 'lines': ['0.10']})
+
+    @override_settings(REST_FRAMEWORK={'COERCE_DECIMAL_TO_STRING': False})
+    def test_decimal_as_float_when_not_coerced(self):
+        self.assertEqual(json.loads(self.render({'total': Decimal('2.5')})), {'total': 2.5})
+
+    def test_lazy_translation(self):
+        data = {'detail': gettext_lazy('Not found.')}
+        content = self.render(data)
+        self.assertEqual(json.loads(content), {'detail': str(data['detail'])})
+        self.assertEqual(content, self.drf_render(data))
+
+    def test_line_separators_escaped(self):
+        data = {'text': 'a\u2028b\u2029c'}
+        content = self.render(data)
+        self.assertEqual(content, b'{"text":"a\\u2028b\\u2029c"}')
+        self.assertEqual(content, self.drf_render(data))
+
+    def test_indent_uses_stdlib(self):
+        media_type = 'application/json; indent=2'
+        with mock.patch.object(renderers, 'orjson_dumps') as orjson_dumps:
+            content = self.render(DOCUMENT, media_type)
+        orjson_dumps.assert_not_called()
+        self.assertEqual(content, self.drf_render(DOCUMENT, media_type))
+        self.assertIn(b'\n  "id": 1', content)
+
+    def test_big_integer_uses_stdlib(self):
+        data = {'id': 2 ** 70, 'price': Decimal('1.00')}
+        self.assertEqual(self.render(data), b'{"id":1180591620717411303424,"price":"1.00"}')
+
+    def test_without_orjson(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(self.render(DOCUMENT), self.drf_render(DOCUMENT))
+            self.assertEqual(json.loads(self.render({'total': Decimal('1.50')})), {'total': '1.50'})
+
+
+
+IMAGE = bytes(range(256)) * 20
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """
+    Serves ``server.files`` ({path: (body, etag)}) with Range/If-Range
+    support; paths in ``server.unavailable`` answer 503 once.
+    """
+
+    def do_GET(self):
+        self.server.received.append((self.path, self.headers))
+        if self.path in self.server.unavailable:
+            self.server.unavailable.remove(self.path)
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        if self.path not in self.server.files:
+            self.send_error(404)
+            return
+
+        body, etag = self.server.files[self.path]
+        start = 0
+        byte_range = self.headers.get('Range')
+        if byte_range and self.headers.get('If-Range', etag) == etag:
+            start = int(byte_range.removeprefix('bytes=').rstrip('-'))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(body)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'image/png' if self.path.endswith('.png') else 'image/jpeg')
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadRealImagesTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+        self.server.files = {
+            '/image.jpg': (IMAGE, '"v1"'),
+            '/copy.jpg': (IMAGE, '"v1"'),
+            '/photo.png': (IMAGE[::-1], '"p1"'),
+            '/tiny.jpg': (b'x' * 10, '"t1"'),
+        }
+        self.server.unavailable = set()
+        self.server.received = []
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.images_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.images_dir)
+        self.downloads_dir = os.path.join(self.images_dir, download_real_images.DOWNLOADS_DIR)
+        self.enterContext(redirect_stdout(io.StringIO()))
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def requests_for(self, path):
+        return [headers for received, headers in self.server.received if received == path]
+
+    def download(self, path):
+        downloader = ImageDownloader(self.images_dir, retries=1, backoff=0)
+        try:
+            return downloader.fetch(self.url(path)).result()
+        finally:
+            downloader.close()
+
+    def part_path(self, path):
+        digest = download_real_images.hashlib.sha1(self.url(path).encode()).hexdigest()
+        return os.path.join(self.downloads_dir, digest + '.part')
+
+    def test_download_all(self):
+        self.server.unavailable.add('/photo.png')
+        downloaded, failed = download_all_images({
+            'first': [self.url('/missing.jpg'), self.url('/image.jpg')],
+            'second': [self.url('/copy.jpg'), self.url('/image.jpg')],
+            'third': [self.url('/photo.png')],
+            'broken': [self.url('/tiny.jpg')],
+        }, self.images_dir, retries=1)
+        self.assertEqual((downloaded, failed), (3, ['broken']))
+        self.assertEqual(self.read(os.path.join(self.images_dir, 'first.jpg')), IMAGE)
+        self.assertEqual(self.read(os.path.join(self.images_dir, 'second.jpg')), IMAGE)
+        self.assertEqual(self.read(os.path.join(self.images_dir, 'third.png')), IMAGE[::-1])
+        # Same content from two URLs is stored once; nothing is left half-done
+        self.assertEqual(sorted(os.path.splitext(name)[1] for name in os.listdir(self.downloads_dir)), ['.jpg', '.png'])
+        self.assertEqual(len(self.requests_for('/photo.png')), 2)
+        self.assertEqual(len(self.requests_for('/image.jpg')), 1)
+
+        # Products that already have a real image are skipped
+        self.server.received.clear()
+        with open(os.path.join(self.images_dir, 'first.jpg'), 'wb') as f:
+            f.write(b'x' * (download_real_images.REAL_IMAGE_SIZE + 1))
+        self.assertEqual(download_all_images({'first': [self.url('/image.jpg')]}, self.images_dir), (0, []))
+        self.assertEqual(self.server.received, [])
+
+    def write_part(self, path, content, validator):
+        os.makedirs(self.downloads_dir, exist_ok=True)
+        part = self.part_path(path)
+        with open(part, 'wb') as f:
+            f.write(content)
+        download_real_images.write_validator(part, validator)
+
+    def test_resume(self):
+        self.write_part('/image.jpg', IMAGE[:3000], '"v1"')
+        self.assertEqual(self.read(self.download('/image.jpg')), IMAGE)
+        headers, = self.requests_for('/image.jpg')
+        self.assertEqual(headers['Range'], 'bytes=3000-')
+        self.assertEqual(headers['If-Range'], '"v1"')
+        self.assertEqual(os.listdir(self.downloads_dir), [os.path.basename(self.download('/image.jpg'))])
+
+    def test_resume_complete_part(self):
+        self.write_part('/image.jpg', IMAGE, '"v1"')
+        self.assertEqual(self.read(self.download('/image.jpg')), IMAGE)
+
+    def test_resume_changed_file(self):
+        # The server has a new version: If-Range makes it send the whole file
+        self.write_part('/photo.png', IMAGE[:3000], '"p0"')
+        self.assertEqual(self.read(self.download('/photo.png')), IMAGE[::-1])
+        headers, = self.requests_for('/photo.png')
+        self.assertEqual(headers['If-Range'], '"p0"')
+
+    def test_part_without_validator_restarted(self):
+        self.write_part('/image.jpg', b'garbage' * 500, None)
+        self.assertEqual(self.read(self.download('/image.jpg')), IMAGE)
+        headers, = self.requests_for('/image.jpg')
+        self.assertIsNone(headers['Range'])
+
+    def test_interrupted_download_resumed(self):
+        store = ImageDownloader._store
+        interrupted = []
+
+        def store_interrupted_once(downloader, url, part, response):
+            if not interrupted:
+                interrupted.append(url)
+                response.iter_content = lambda chunk_size: truncated(IMAGE[:3000])
+            return store(downloader, url, part, response)
+
+        with mock.patch.object(ImageDownloader, '_store', store_interrupted_once):
+            self.assertEqual(self.read(self.download('/image.jpg')), IMAGE)
+        first, retry = self.requests_for('/image.jpg')
+        self.assertIsNone(first['Range'])
+        self.assertEqual(retry['Range'], 'bytes=3000-')
+        self.assertEqual(retry['If-Range'], '"v1"')
+
+    def test_disk_error_fails_one_url(self):
+        store = ImageDownloader._store
+
+        def store_or_fail(downloader, url, part, response):
+            if url.endswith('/copy.jpg'):
+                raise OSError(28, 'No space left on device')
+            return store(downloader, url, part, response)
+
+        with mock.patch.object(ImageDownloader, '_store', store_or_fail):
+            downloaded, failed = download_all_images({
+                'first': [self.url('/copy.jpg')],
+                'second': [self.url('/photo.png')],
+            }, self.images_dir, retries=0)
+        self.assertEqual((downloaded, failed), (1, ['first']))
+        self.assertTrue(os.path.exists(os.path.join(self.images_dir, 'second.png')))
+
+
+
+def truncated(content):
+    yield content
+    raise download_real_images.requests.exceptions.ChunkedEncodingError('connection reset')
@@ -20,6 +20,9 @@ from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenRefreshView
 
+from products.storage import CONTENT_DIR
+from products.views import content_addressed_media
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/products/', include('products.urls')),
@@ -29,4 +32,8 @@ urlpatterns = [
 ]
 
 if settings.DEBUG:
+    urlpatterns += [
+        # Hash-named files never change: served with a far-future Cache-Control
+        path(f"{settings.MEDIA_URL.lstrip('/')}{CONTENT_DIR}/<path:path>", content_addressed_media),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Нагрузочный тест резервирования товара при оформлении заказа
+Одновременно отправляет сотни заказов на один и тот же товар и
+показывает пропускную способность и количество перепроданных единиц.
+Работает на временной тестовой базе, рабочая база не затрагивается.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from django.db import connection, connections
+from rest_framework.test import APIClient
+
+from orders.models import OrderItem
+from products.models import Category, Product
+
+
+def checkout(product_id, quantity, start):
+    start.wait()
+    client = APIClient()
+    try:
+        response = client.post('/api/orders/create-order/', {
+            'first_name': 'Load', 'last_name': 'Test', 'email': 'load@example.com',
+            'phone': '0', 'address': 'Street 1', 'city': 'City', 'postal_code': '000000',
+            'items': [{
+                'product_id': product_id, 'product_name': 'SKU',
+                'product_price': '100.00', 'quantity': quantity, 'total_price': '0',
+            }],
+        }, format='json')
+        return response.status_code
+    finally:
+        connections.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--checkouts', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--quantity', type=int, default=1)
+    args = parser.parse_args()
+
+    settings_dict = connection.settings_dict
+    old_name = settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        # Threads need a shared on-disk database; IMMEDIATE makes writers
+        # queue on the busy timeout instead of failing on lock upgrade
+        settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'checkout.sqlite3')
+        settings_dict['OPTIONS'].update({'transaction_mode': 'IMMEDIATE', 'timeout': 60})
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        category = Category.objects.create(name='Benchmark', slug='benchmark')
+        product = Product.objects.create(
+            name='SKU', slug='sku', description='Benchmark SKU', price='100.00',
+            category=category, product_type='component', brand='Bench', model='1',
+            stock_quantity=args.stock,
+        )
+        connections.close_all()
+
+        start = threading.Event()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = [
+                pool.submit(checkout, product.id, args.quantity, start)
+                for _ in range(args.checkouts)
+            ]
+            started = time.perf_counter()
+            start.set()
+            statuses = [future.result() for future in futures]
+            elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        sold = sum(OrderItem.objects.filter(product=product).values_list('quantity', flat=True))
+        accepted = statuses.count(201)
+        rejected = statuses.count(409)
+
+        print("=" * 80)
+        print(f"Checkouts:      {args.checkouts} x {args.quantity} unit(s), {args.workers} workers")
+        print(f"Accepted:       {accepted}")
+        print(f"Rejected (409): {rejected}")
+        print(f"Other statuses: {len(statuses) - accepted - rejected}")
+        print(f"Throughput:     {args.checkouts / elapsed:,.0f} checkouts/s ({elapsed:.2f}s)")
+        print(f"Stock:          {args.stock} -> {product.stock_quantity}")
+        print(f"Oversold:       {max(0, sold - args.stock)} unit(s)")
+        print("=" * 80)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Бенчмарк рендеринга JSON для страницы из 1000 товаров
+Сравнивает стандартный JSONRenderer DRF с FastJSONRenderer (orjson и
+запасной путь на stdlib): время рендеринга и объём выделенной памяти.
+Работает на временной тестовой базе, рабочая база не затрагивается.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import django
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from backend import renderers
+from backend.renderers import FastJSONRenderer
+from products.models import Category, Product
+from products.serializers import ProductListSerializer
+
+
+def create_catalog(total):
+    # bulk_create: no signals, the placeholder image names need no derivatives
+    categories = Category.objects.bulk_create([
+        Category(name=f'Категория {i}', slug=f'category-{i}', image=f'categories/c{i}.png')
+        for i in range(10)
+    ])
+    Product.objects.bulk_create([
+        Product(
+            name=f'Товар {i}', slug=f'product-{i}', description='Benchmark product',
+            price=f'{100 + i % 900}.99', category=categories[i % len(categories)],
+            product_type='computer', brand=f'Brand {i % 20}', model=f'M{i}',
+            image=f'products/product-{i}.png', stock_quantity=i % 7,
+        )
+        for i in range(total)
+    ], batch_size=500)
+
+
+def measure(render, data, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render(data)
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    content = render(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return content, best, peak
+
+
+def render_stdlib_fallback(data):
+    # The path FastJSONRenderer takes when orjson is not installed
+    return JSONRenderer.render(FastJSONRenderer(), data, 'application/json')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        create_catalog(args.products)
+        request = Request(APIRequestFactory().get('/api/products/products/'))
+        queryset = Product.objects.select_related('category')[:args.products]
+        page = {
+            'count': args.products, 'next': None, 'previous': None,
+            'results': ProductListSerializer(queryset, many=True, context={'request': request}).data,
+        }
+
+        candidates = [
+            ('DRF JSONRenderer', lambda data: JSONRenderer().render(data, 'application/json')),
+            ('FastJSONRenderer (stdlib)', render_stdlib_fallback),
+        ]
+        if renderers.orjson is not None:
+            candidates.append(
+                ('FastJSONRenderer (orjson)', lambda data: FastJSONRenderer().render(data, 'application/json'))
+            )
+
+        print("=" * 80)
+        print(f"{len(page['results'])} products")
+        print(f"{'renderer':<28} {'ms':>10} {'peak KiB':>12} {'bytes':>12} {'speedup':>10}")
+        print("=" * 80)
+        baseline_content, baseline_time = None, None
+        for name, render in candidates:
+            content, elapsed, peak = measure(render, page, args.repeat)
+            if baseline_content is None:
+                baseline_content, baseline_time = content, elapsed
+            assert content == baseline_content, f'{name} output differs from JSONRenderer'
+            print(f"{name:<28} {elapsed * 1000:>10.2f} {peak / 1024:>12,.0f} "
+                  f"{len(content):>12,} {baseline_time / elapsed:>9.1f}x")
+        if renderers.orjson is None:
+            print("orjson is not installed, only the stdlib fallback was measured")
+        print("=" * 80)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Бенчмарк сериализации списка товаров (ProductListSerializer)
+Сравнивает старый путь (без select_related, поля DRF построчно)
+с текущим (select_related + CompiledListSerializer).
+Работает на временной тестовой базе, рабочая база не затрагивается.
+"""
+import argparse
+import os
+import sys
+import time
+
+import django
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products.models import Category, Product
+from products.serializers import ProductListSerializer
+
+PAGE_SIZES = [20, 200, 1000]
+
+
+def create_catalog(total):
+    # bulk_create: no signals, the placeholder image names need no derivatives
+    categories = Category.objects.bulk_create([
+        Category(name=f'Category {i}', slug=f'category-{i}', image=f'categories/c{i}.png')
+        for i in range(10)
+    ])
+    Product.objects.bulk_create([
+        Product(
+            name=f'Product {i}', slug=f'product-{i}', description='Benchmark product',
+            price=f'{100 + i % 900}.99', category=categories[i % len(categories)],
+            product_type='computer', brand=f'Brand {i % 20}', model=f'M{i}',
+            image=f'products/product-{i}.png', stock_quantity=i % 7,
+        )
+        for i in range(total)
+    ], batch_size=500)
+
+
+def serialize_before(size, context):
+    queryset = Product.objects.filter(is_active=True).order_by('-created_at')[:size]
+    child = ProductListSerializer()
+    return serializers.ListSerializer(queryset, child=child, context=context).data
+
+
+def serialize_after(size, context):
+    queryset = (
+        Product.objects.filter(is_active=True)
+        .select_related('category')
+        .order_by('-created_at')[:size]
+    )
+    return ProductListSerializer(queryset, many=True, context=context).data
+
+
+def measure(func, size, context, repeat):
+    with CaptureQueriesContext(connection) as queries:
+        data = func(size, context)
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(size, context)
+        best = min(best, time.perf_counter() - started)
+    return data, len(queries), size / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        create_catalog(max(args.products, max(PAGE_SIZES)))
+        request = Request(APIRequestFactory().get('/api/products/products/'))
+        context = {'request': request}
+
+        print("=" * 80)
+        print(f"{'page size':>10} {'queries':>16} {'rows/s before':>16} {'rows/s after':>16} {'speedup':>10}")
+        print("=" * 80)
+        for size in PAGE_SIZES:
+            before, before_queries, before_rate = measure(serialize_before, size, context, args.repeat)
+            after, after_queries, after_rate = measure(serialize_after, size, context, args.repeat)
+            assert before == after, 'fast path output differs from DRF output'
+            print(f"{size:>10} {f'{before_queries} -> {after_queries}':>16} "
+                  f"{before_rate:>16,.0f} {after_rate:>16,.0f} {after_rate / before_rate:>9.1f}x")
+        print("=" * 80)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
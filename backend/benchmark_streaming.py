@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Бенчмарк потоковой выдачи списка товаров (?stream=1)
+Сравнивает обычный ответ ProductListView с потоковым: время до первого
+байта, общее время и пиковое потребление памяти.
+Работает на временной тестовой базе, рабочая база не затрагивается.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import django
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from django.core.cache import caches
+from django.conf import settings
+from django.db import connection
+from rest_framework.test import APIClient
+
+from products.models import Category, Product
+
+PAGE_SIZES = [100, 1000]
+
+
+def create_catalog(total):
+    # bulk_create: no signals, the placeholder image names need no derivatives
+    categories = Category.objects.bulk_create([
+        Category(name=f'Category {i}', slug=f'category-{i}', image=f'categories/c{i}.png')
+        for i in range(10)
+    ])
+    Product.objects.bulk_create([
+        Product(
+            name=f'Product {i}', slug=f'product-{i}', description='Benchmark product ' * 20,
+            price=f'{100 + i % 900}.99', category=categories[i % len(categories)],
+            product_type='computer', brand=f'Brand {i % 20}', model=f'M{i}',
+            image=f'products/product-{i}.png', stock_quantity=i % 7,
+        )
+        for i in range(total)
+    ], batch_size=500)
+
+
+def fetch(client, url):
+    caches[settings.CATALOG_CACHE_ALIAS].clear()
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(url)
+    if response.streaming:
+        chunks = iter(response.streaming_content)
+        first = next(chunks)
+        first_byte = time.perf_counter() - started
+        size = len(first) + sum(len(chunk) for chunk in chunks)
+    else:
+        first_byte = time.perf_counter() - started
+        size = len(response.content)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first_byte, elapsed, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=2000)
+    args = parser.parse_args()
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        create_catalog(max(args.products, max(PAGE_SIZES)))
+        client = APIClient()
+
+        print("=" * 80)
+        print(f"{'page size':>10} {'mode':>10} {'first byte ms':>15} {'total ms':>10} {'peak KiB':>10} {'bytes':>12}")
+        print("=" * 80)
+        for size in PAGE_SIZES:
+            for mode, extra in (('buffered', ''), ('stream', '&stream=1')):
+                first_byte, elapsed, peak, length = fetch(
+                    client, f'/api/products/products/?page_size={size}{extra}'
+                )
+                print(f"{size:>10} {mode:>10} {first_byte * 1000:>15.1f} {elapsed * 1000:>10.1f} "
+                      f"{peak / 1024:>10,.0f} {length:>12,}")
+        print("=" * 80)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
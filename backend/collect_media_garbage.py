@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""
+Скрипт для удаления файлов медиа, на которые больше не ссылается ни одна запись
+Файлы хранятся по хешу содержимого и могут использоваться несколькими товарами,
+поэтому удаляются не сразу, а этим периодическим проходом (например, из cron).
+Файлы, сохранённые за последние --grace-hours часов, не трогаются.
+"""
+import argparse
+import os
+import sys
+
+import django
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from django.core.files.storage import default_storage
+
+from products.storage import ContentAddressedStorage
+
+
+def collect_media_garbage(grace_hours=24, dry_run=False):
+    if not isinstance(default_storage, ContentAddressedStorage):
+        print("Hranilishche ne content-addressed, udalyat nechego")
+        return
+    deleted = default_storage.collect_garbage(grace=grace_hours * 60 * 60, dry_run=dry_run)
+    prefix = '[DRY-RUN] ' if dry_run else ''
+    for name in deleted:
+        print(f"{prefix}Udalen: {name}")
+    print(f"\n{prefix}Udaleno faylov: {len(deleted)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--grace-hours', type=float, default=24,
+                        help='Keep unreferenced files saved within this many hours')
+    parser.add_argument('--dry-run', action='store_true', help='Only list the files to delete')
+    args = parser.parse_args()
+    collect_media_garbage(grace_hours=args.grace_hours, dry_run=args.dry_run)
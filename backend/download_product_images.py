@@ -2,12 +2,16 @@
 """
 Скрипт для создания placeholder изображений для товаров
 Использует Pillow для генерации изображений с текстом
+Изображения рисуются параллельно в нескольких процессах (--workers)
 """
+import argparse
 import os
 import sys
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+
 import django
 from PIL import Image, ImageDraw, ImageFont
-import textwrap
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
@@ -15,131 +19,168 @@ django.setup()
 
 from products.models import Product
 
+# Размер изображения
+WIDTH, HEIGHT = 800, 600
+
+# (крупный, средний, мелкий) шрифт, первый найденный набор
+FONT_CANDIDATES = [
+    ("arial.ttf", "arial.ttf", "arial.ttf"),
+    (
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    ),
+]
+FONT_SIZES = (48, 32, 24)
+
+PRODUCT_FIELDS = ('slug', 'name', 'category__name', 'brand', 'model', 'price')
+
+# Шрифты и фон загружаются один раз на процесс (см. init_worker)
+_fonts = None
+_background = None
+
+
+def load_fonts():
+    for paths in FONT_CANDIDATES:
+        try:
+            return tuple(ImageFont.truetype(path, size) for path, size in zip(paths, FONT_SIZES))
+        except OSError:
+            continue
+    default = ImageFont.load_default()
+    return default, default, default
+
+
+def create_background():
+    """Градиентный фон с рамкой, одинаковый для всех товаров"""
+    # Градиент строится как столбец шириной 1px и растягивается одной операцией
+    column = Image.new('RGB', (1, HEIGHT))
+    column.putdata([
+        (int(30 + (y / HEIGHT) * 20), int(41 + (y / HEIGHT) * 20), int(59 + (y / HEIGHT) * 20))
+        for y in range(HEIGHT)
+    ])
+    img = column.resize((WIDTH, HEIGHT), Image.Resampling.NEAREST)
+
+    # Рисуем рамку
+    ImageDraw.Draw(img).rectangle([10, 10, WIDTH - 10, HEIGHT - 10], outline='#3b82f6', width=3)
+    return img
+
+
+def init_worker():
+    global _fonts, _background
+    _fonts = load_fonts()
+    _background = create_background()
+
+
+def draw_centered(draw, y, text, fill, font):
+    bbox = draw.textbbox((0, 0), text, font=font)
+    text_width = bbox[2] - bbox[0]
+    draw.text(((WIDTH - text_width) // 2, y), text, fill=fill, font=font)
+
+
 def create_product_image(product, output_path):
-    """Создает изображение для товара"""
-    # Размер изображения
-    width, height = 800, 600
-    
-    # Создаем изображение с градиентом
-    img = Image.new('RGB', (width, height), color='#1e293b')  # slate-900
+    """Создает изображение для товара (product - словарь полей PRODUCT_FIELDS)"""
+    if _background is None:
+        init_worker()
+    font_large, font_medium, font_small = _fonts
+
+    img = _background.copy()
     draw = ImageDraw.Draw(img)
-    
-    # Рисуем градиентный фон
-    for y in range(height):
-        r = int(30 + (y / height) * 20)
-        g = int(41 + (y / height) * 20)
-        b = int(59 + (y / height) * 20)
-        draw.line([(0, y), (width, y)], fill=(r, g, b))
-    
-    # Рисуем рамку
-    draw.rectangle([10, 10, width-10, height-10], outline='#3b82f6', width=3)
-    
-    # Текст товара
-    try:
-        # Пробуем использовать системный шрифт
-        try:
-            font_large = ImageFont.truetype("arial.ttf", 48)
-            font_medium = ImageFont.truetype("arial.ttf", 32)
-            font_small = ImageFont.truetype("arial.ttf", 24)
-        except:
-            try:
-                font_large = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 48)
-                font_medium = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 32)
-                font_small = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 24)
-            except:
-                font_large = ImageFont.load_default()
-                font_medium = ImageFont.load_default()
-                font_small = ImageFont.load_default()
-    except:
-        font_large = ImageFont.load_default()
-        font_medium = ImageFont.load_default()
-        font_small = ImageFont.load_default()
-    
+
     # Название категории
-    category_text = product.category.name
-    bbox = draw.textbbox((0, 0), category_text, font=font_small)
-    text_width = bbox[2] - bbox[0]
-    draw.text(((width - text_width) // 2, 50), category_text, 
-              fill='#94a3b8', font=font_small)
-    
-    # Название товара (разбиваем на строки)
-    product_name = product.name
-    # Ограничиваем длину названия
+    draw_centered(draw, 50, product['category__name'], '#94a3b8', font_small)
+
+    # Название товара (разбиваем на строки), ограничиваем длину названия
+    product_name = product['name']
     if len(product_name) > 40:
         product_name = product_name[:37] + "..."
-    
-    lines = textwrap.wrap(product_name, width=30)
+
     y_offset = 200
-    for line in lines:
-        bbox = draw.textbbox((0, 0), line, font=font_large)
-        text_width = bbox[2] - bbox[0]
-        draw.text(((width - text_width) // 2, y_offset), line, 
-                  fill='#ffffff', font=font_large)
+    for line in textwrap.wrap(product_name, width=30):
+        draw_centered(draw, y_offset, line, '#ffffff', font_large)
         y_offset += 60
-    
+
     # Бренд и модель
-    brand_model = f"{product.brand} {product.model}"
-    bbox = draw.textbbox((0, 0), brand_model, font=font_medium)
-    text_width = bbox[2] - bbox[0]
-    draw.text(((width - text_width) // 2, y_offset + 20), brand_model, 
-              fill='#60a5fa', font=font_medium)
-    
+    draw_centered(draw, y_offset + 20, f"{product['brand']} {product['model']}", '#60a5fa', font_medium)
+
     # Цена
-    price_text = f"{int(product.price):,} USD"
-    bbox = draw.textbbox((0, 0), price_text, font=font_medium)
-    text_width = bbox[2] - bbox[0]
-    draw.text(((width - text_width) // 2, height - 100), price_text, 
-              fill='#10b981', font=font_medium)
-    
+    draw_centered(draw, HEIGHT - 100, f"{int(product['price']):,} USD", '#10b981', font_medium)
+
     # Сохраняем изображение
-    img.save(output_path, 'PNG', quality=95)
+    img.save(output_path, 'PNG')
     return True
 
-def generate_product_images():
+
+def render_product(task):
+    product, output_path = task
+    try:
+        create_product_image(product, output_path)
+        return product['slug'], None
+    except Exception as e:
+        return product['slug'], str(e)
+
+
+def generate_product_images(workers=None, all_types=False):
     """Генерирует изображения для всех товаров без изображений"""
     # Создаем папку для изображений
     images_dir = os.path.join(os.path.dirname(__file__), 'product_images')
     os.makedirs(images_dir, exist_ok=True)
-    
-    # Получаем все товары без изображений
-    products = Product.objects.filter(product_type='computer')
-    
+    # Один просмотр папки вместо проверки существования файла для каждого товара
+    existing = set(os.listdir(images_dir))
+
+    products = Product.objects.all() if all_types else Product.objects.filter(product_type='computer')
+    products = products.order_by('pk').values(*PRODUCT_FIELDS)
+
     print("=" * 80)
     print("GENERATING PRODUCT IMAGES")
     print("=" * 80)
-    
+
     generated = 0
     skipped = 0
-    
-    for product in products:
-        filepath = os.path.join(images_dir, f"{product.slug}.png")
-        
+    failed = 0
+
+    tasks = []
+    for product in products.iterator(chunk_size=2000):
+        filename = f"{product['slug']}.png"
         # Пропускаем если уже существует
-        if os.path.exists(filepath):
-            print(f"[SKIP] {product.slug} - already exists")
+        if filename in existing:
             skipped += 1
             continue
-        
-        print(f"[GENERATE] {product.name}...")
-        try:
-            if create_product_image(product, filepath):
-                print(f"  [OK] Generated: {os.path.basename(filepath)}")
-                generated += 1
-        except Exception as e:
-            print(f"  [ERROR] {e}")
-    
+        tasks.append((product, os.path.join(images_dir, filename)))
+
+    workers = workers or os.cpu_count() or 1
+    print(f"To generate: {len(tasks)}, workers: {workers}")
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        chunksize = max(1, min(64, len(tasks) // (workers * 4)))
+        for slug, error in executor.map(render_product, tasks, chunksize=chunksize):
+            if error:
+                print(f"  [ERROR] {slug}: {error}")
+                failed += 1
+                continue
+            generated += 1
+            if generated % 500 == 0:
+                print(f"[GENERATE] {generated}/{len(tasks)}")
+
     print("=" * 80)
     print(f"Generated: {generated}")
     print(f"Skipped: {skipped}")
+    if failed:
+        print(f"Failed: {failed}")
     print("=" * 80)
-    
+
     if generated > 0:
         print("\nImages generated successfully!")
         print("Now run: python upload_product_images.py")
 
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--all-types', action='store_true',
+                        help='Generate images for every product, not only computers')
+    args = parser.parse_args()
     try:
-        generate_product_images()
+        generate_product_images(workers=args.workers, all_types=args.all_types)
     except Exception as e:
         print(f"Error: {e}")
         print("Make sure Pillow is installed: pip install Pillow")
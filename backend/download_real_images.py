@@ -2,12 +2,23 @@
 """
 Скрипт для скачивания реальных изображений товаров из интернета
 Использует прямые ссылки на изображения
+Скачивает параллельно через общий пул соединений, с повторами, докачкой
+прерванных файлов и без повторной загрузки одинаковых URL и содержимого
 """
+import argparse
+import hashlib
+import json
 import os
+import shutil
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
 import django
 import requests
-from urllib.parse import urlparse
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
@@ -61,103 +72,291 @@ IMAGE_URLS = {
     ],
 }
 
-def download_image(url, filepath):
-    """Скачивает изображение по URL"""
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+
+# Файлы меньше этого размера считаются ошибкой (страницы-заглушки и т.п.)
+MIN_IMAGE_SIZE = 1000
+# Реальное изображение товара, которое не нужно скачивать заново
+REAL_IMAGE_SIZE = 50000
+
+# Временные ответы сервера, после которых стоит повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Папка для недокачанных (.part) и скачанных файлов, по хешу URL и содержимого
+DOWNLOADS_DIR = '.downloads'
+
+
+def image_extension(url, content_type):
+    """Определяем расширение из URL или Content-Type"""
+    path = urlparse(url).path.lower()
+    if '.jpg' in path or '.jpeg' in path:
+        return '.jpg'
+    if '.png' in path:
+        return '.png'
+    if 'image/png' in content_type:
+        return '.png'
+    return '.jpg'
+
+
+def retry_delay(response, attempt, backoff):
+    """Пауза перед повтором: Retry-After сервера или экспоненциальная"""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), 60)
+        except ValueError:
+            try:
+                return min(max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0), 60)
+            except (TypeError, ValueError):
+                pass
+    return backoff * 2 ** attempt
+
+
+def range_validator(response):
+    """Валидатор для If-Range: строгий ETag или Last-Modified (слабый ETag не подходит)"""
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+
+def read_validator(part):
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=15, stream=True)
-        response.raise_for_status()
-        
-        # Определяем расширение из URL или Content-Type
-        parsed = urlparse(url)
-        path = parsed.path.lower()
-        
-        if '.jpg' in path or '.jpeg' in path:
-            ext = '.jpg'
-        elif '.png' in path:
-            ext = '.png'
-        elif 'image/jpeg' in response.headers.get('content-type', ''):
-            ext = '.jpg'
-        elif 'image/png' in response.headers.get('content-type', ''):
-            ext = '.png'
-        else:
-            ext = '.jpg'
-        
-        filepath_with_ext = filepath.rsplit('.', 1)[0] + ext
-        
-        with open(filepath_with_ext, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        
+        with open(part + '.validator', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_validator(part, validator):
+    """Сохраняет валидатор ответа рядом с .part (None - удаляет)"""
+    path = part + '.validator'
+    if validator:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(validator)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class ImageDownloader:
+    """
+    Скачивает URL в общий пул файлов ``<images_dir>/.downloads``.
+
+    Все потоки используют одну requests.Session (keep-alive, пул соединений
+    на хост), а семафоры ограничивают число одновременных запросов к
+    одному хосту. Прерванная загрузка остаётся в ``<sha1 url>.part`` и
+    продолжается запросом Range с If-Range (валидатор ответа хранится в
+    ``.part.validator``), так что изменившийся на сервере файл скачивается
+    заново, а не дописывается к старому; готовый файл хранится под SHA-256 своего
+    содержимого, так что одинаковые картинки с разных URL лежат один раз.
+    """
+
+    def __init__(self, images_dir, workers=8, per_host=4, retries=3, backoff=0.5, timeout=15):
+        self.downloads_dir = os.path.join(images_dir, DOWNLOADS_DIR)
+        os.makedirs(self.downloads_dir, exist_ok=True)
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=max(workers, per_host))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.host_limits = {}
+        # URL -> Future с путём к файлу содержимого (или None)
+        self.results = {}
+
+    def close(self):
+        self.executor.shutdown()
+        self.session.close()
+
+    def fetch(self, url):
+        """Future с путём к скачанному файлу; каждый URL скачивается один раз"""
+        with self.lock:
+            if url not in self.results:
+                self.results[url] = self.executor.submit(self._download, url)
+            return self.results[url]
+
+    def _host_limit(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self.host_limits[host]
+
+    def _download(self, url):
+        part = os.path.join(self.downloads_dir, hashlib.sha1(url.encode()).hexdigest() + '.part')
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                with self._host_limit(url):
+                    response = self._request(url, part)
+                    if response.status_code == 416 and os.path.exists(part):
+                        # В .part уже весь файл
+                        return self._store(url, part, response)
+                    if response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        return self._store(url, part, response)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                # Скачанная часть остаётся в .part и докачивается при следующей попытке
+                error = e
+            except requests.RequestException as e:
+                print(f"  Error: {url[:60]}: {str(e)[:50]}")
+                return None
+            except OSError as e:
+                # Ошибка записи на диск (нет места, нет прав) - только этот URL считается неудачным
+                print(f"  Error: {url[:60]}: {str(e)[:50]}")
+                return None
+            else:
+                error = f"HTTP {response.status_code}"
+            finally:
+                if response is not None:
+                    response.close()
+            if attempt < self.retries:
+                time.sleep(retry_delay(response, attempt, self.backoff))
+        print(f"  Error: {url[:60]}: {str(error)[:50]}")
+        return None
+
+    def _request(self, url, part):
+        headers = {}
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        validator = read_validator(part) if offset else None
+        # Без валидатора нельзя проверить, что файл на сервере тот же: качаем заново
+        if validator:
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = validator
+        return self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+
+    def _store(self, url, part, response):
+        # 206 - докачка продолжает .part, 200 - сервер прислал файл целиком
+        mode = 'ab' if response.status_code == 206 else 'wb'
+        if mode == 'wb' and response.status_code != 416:
+            write_validator(part, range_validator(response))
+        if response.status_code != 416:
+            with open(part, mode) as f:
+                for chunk in response.iter_content(chunk_size=65536):
+                    if chunk:
+                        f.write(chunk)
+
         # Проверяем что файл не пустой
-        if os.path.getsize(filepath_with_ext) > 1000:
-            return filepath_with_ext
-        else:
-            os.remove(filepath_with_ext)
+        if os.path.getsize(part) <= MIN_IMAGE_SIZE:
+            os.remove(part)
+            write_validator(part, None)
             return None
-    except Exception as e:
-        print(f"  Error: {str(e)[:50]}")
-        return None
 
-def download_all_images():
+        digest = hashlib.sha256()
+        with open(part, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        ext = image_extension(url, response.headers.get('content-type', ''))
+        content_path = os.path.join(self.downloads_dir, digest.hexdigest() + ext)
+        if os.path.exists(content_path):
+            os.remove(part)
+        else:
+            os.replace(part, content_path)
+        write_validator(part, None)
+        return content_path
+
+
+def link_image(content_path, filepath):
+    """Кладёт файл содержимого под имя товара (жёсткая ссылка, если возможно)"""
+    if os.path.exists(filepath):
+        os.remove(filepath)
+    try:
+        os.link(content_path, filepath)
+    except OSError:
+        shutil.copyfile(content_path, filepath)
+
+
+def has_real_image(images_dir, slug):
+    for ext in ('.jpg', '.png'):
+        path = os.path.join(images_dir, f"{slug}{ext}")
+        if os.path.exists(path) and os.path.getsize(path) > REAL_IMAGE_SIZE:
+            return True
+    return False
+
+
+def download_all_images(image_urls=None, images_dir=None, workers=8, per_host=4, retries=3, timeout=15):
     """Скачивает изображения для всех товаров"""
-    images_dir = os.path.join(os.path.dirname(__file__), 'product_images')
+    image_urls = IMAGE_URLS if image_urls is None else image_urls
+    images_dir = images_dir or os.path.join(os.path.dirname(__file__), 'product_images')
     os.makedirs(images_dir, exist_ok=True)
-    
+
     print("=" * 80)
     print("DOWNLOADING REAL PRODUCT IMAGES")
     print("=" * 80)
-    
-    downloaded = 0
-    failed = []
-    
-    for slug, urls in IMAGE_URLS.items():
-        filepath = os.path.join(images_dir, f"{slug}.jpg")
-        
+
+    pending = {}
+    for slug, urls in image_urls.items():
         # Пропускаем если уже существует реальное изображение
-        if os.path.exists(filepath) and os.path.getsize(filepath) > 50000:
+        if has_real_image(images_dir, slug):
             print(f"[SKIP] {slug} - already has real image")
             continue
-        
-        print(f"[DOWNLOAD] {slug}...")
-        success = False
-        
-        # Пробуем скачать с каждого URL
-        for url in urls:
-            result = download_image(url, filepath)
-            if result:
-                print(f"  [OK] Downloaded: {os.path.basename(result)}")
-                downloaded += 1
-                success = True
-                break
-        
-        if not success:
-            print(f"  [FAILED] Could not download")
-            failed.append(slug)
-    
+        pending[slug] = list(urls)
+
+    downloader = ImageDownloader(images_dir, workers=workers, per_host=per_host, retries=retries, timeout=timeout)
+    downloaded = 0
+    failed = []
+    try:
+        # Раунд за раундом: каждому товару - его следующий URL, все запросы раунда параллельно
+        while pending:
+            futures = {slug: downloader.fetch(urls.pop(0)) for slug, urls in pending.items()}
+            for slug, future in futures.items():
+                content_path = future.result()
+                if content_path:
+                    filepath = os.path.join(images_dir, slug + os.path.splitext(content_path)[1])
+                    try:
+                        link_image(content_path, filepath)
+                    except OSError as e:
+                        print(f"  Error: {filepath}: {str(e)[:50]}")
+                        content_path = None
+                if content_path:
+                    print(f"  [OK] Downloaded: {os.path.basename(filepath)}")
+                    downloaded += 1
+                    del pending[slug]
+                elif not pending[slug]:
+                    print(f"  [FAILED] {slug}: could not download")
+                    del pending[slug]
+                    failed.append(slug)
+    finally:
+        downloader.close()
+
     print("=" * 80)
-    print(f"Downloaded: {downloaded}")
+    print(f"Downloaded: {downloaded} ({len(downloader.results)} unique URLs requested)")
     if failed:
         print(f"Failed: {len(failed)}")
         print("(Will keep placeholder images)")
-    
+
     if downloaded > 0:
         print("\nReal images downloaded!")
         print("Now run: python upload_product_images.py")
     else:
         print("\nNote: Some images could not be downloaded.")
         print("Placeholder images will be used instead.")
+    return downloaded, failed
+
 
 if __name__ == '__main__':
-    try:
-        import requests
-        download_all_images()
-    except ImportError:
-        print("Installing requests...")
-        os.system("pip install requests")
-        import requests
-        download_all_images()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=8, help='Parallel downloads')
+    parser.add_argument('--per-host', type=int, default=4, help='Parallel downloads per host')
+    parser.add_argument('--retries', type=int, default=3, help='Retries per URL on network errors, 429 and 5xx')
+    parser.add_argument('--timeout', type=float, default=15, help='Request timeout, seconds')
+    parser.add_argument('--urls-file', help='JSON {slug: [url, ...]} to use instead of IMAGE_URLS')
+    parser.add_argument('--images-dir', help='Target directory (default: product_images/)')
+    args = parser.parse_args()
 
+    image_urls = None
+    if args.urls_file:
+        with open(args.urls_file, encoding='utf-8') as f:
+            image_urls = json.load(f)
+    download_all_images(
+        image_urls, args.images_dir, workers=args.workers, per_host=args.per_host,
+        retries=args.retries, timeout=args.timeout,
+    )
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Скрипт для создания уменьшенных копий изображений товаров и категорий
+Новые и изменённые изображения обрабатываются автоматически после сохранения
+(см. products/images.py); скрипт нужен для уже загруженных изображений
+и после изменения IMAGE_DERIVATIVE_WIDTHS / IMAGE_DERIVATIVE_FORMATS.
+"""
+import argparse
+import os
+import sys
+
+import django
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from products.cache import category_tag, product_tag, CATEGORIES_TAG, PRODUCTS_TAG
+from products.images import needs_derivatives, update_derivatives
+from products.models import Category, Product
+
+
+def generate_image_derivatives(force=False):
+    targets = [
+        (Category, lambda pk: [category_tag(pk), CATEGORIES_TAG]),
+        (Product, lambda pk: [product_tag(pk), PRODUCTS_TAG]),
+    ]
+    for model, tags in targets:
+        done = failed = 0
+        for instance in model.objects.exclude(image='').exclude(image__isnull=True).only('image', 'image_variants'):
+            if not force and not needs_derivatives(instance):
+                continue
+            try:
+                update_derivatives(model, instance.pk, tags(instance.pk))
+                done += 1
+            except Exception as e:
+                print(f"[ERROR] {model.__name__} {instance.pk} ({instance.image.name}): {e}")
+                failed += 1
+        print(f"{model._meta.verbose_name_plural}: obrabotano {done}, oshibok {failed}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--force', action='store_true', help='Peresozdat vse kopii, dazhe aktualnye')
+    args = parser.parse_args()
+    generate_image_derivatives(force=args.force)
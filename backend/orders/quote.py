@@ -0,0 +1,61 @@
+"""
+Server-side cart pricing.
+
+A quote prices a cart against the current catalog: every product is
+loaded with a single ``id__in`` query, and line totals, stock availability
+and the cart total are computed here instead of trusting client prices.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from products.models import Product
+
+QUOTE_FIELDS = ('id', 'name', 'slug', 'brand', 'price', 'stock_quantity')
+
+
+def build_quote(items_data):
+    """
+    Price ``[{product_id, quantity}, ...]``. Repeated products are merged
+    into one line, in order of first appearance; unknown or inactive
+    products are listed under ``missing``.
+    """
+    quantities = Counter()
+    for item_data in items_data:
+        quantities[item_data['product_id']] += item_data['quantity']
+
+    products = {
+        row['id']: row
+        for row in Product.objects.filter(is_active=True, id__in=list(quantities))
+        .order_by()
+        .values(*QUOTE_FIELDS)
+    }
+
+    lines = []
+    missing = []
+    total_amount = Decimal('0.00')
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None:
+            missing.append(product_id)
+            continue
+        line_total = product['price'] * quantity
+        total_amount += line_total
+        lines.append({
+            'product_id': product_id,
+            'name': product['name'],
+            'slug': product['slug'],
+            'brand': product['brand'],
+            'unit_price': str(product['price']),
+            'quantity': quantity,
+            'line_total': str(line_total),
+            'stock_quantity': product['stock_quantity'],
+            'available': product['stock_quantity'] >= quantity,
+        })
+
+    return {
+        'items': lines,
+        'missing': missing,
+        'total_quantity': sum(line['quantity'] for line in lines),
+        'total_amount': str(total_amount),
+        'available': not missing and all(line['available'] for line in lines),
+    }
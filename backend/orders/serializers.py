@@ -1,11 +1,71 @@
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from .models import Order, OrderItem
+from .stock import reserve_stock
+
+# Upper bound on cart lines priced by one quote request
+MAX_QUOTE_ITEMS = 200
+
+
+def create_order_with_items(validated_data):
+    """
+    Create an order and all of its items in one transaction.
+
+    Items that reference a product take their quantity out of stock first
+    (see orders.stock) and are charged the product's current name and price,
+    whatever the client sent; if any of them is unavailable nothing is
+    written. The order total is always the sum of the line totals.
+
+    Items are inserted with a single bulk_create (so OrderItem.save() is not
+    called and total_price is computed here) and attached to the order as
+    its prefetched `items`, so serializing the result needs no queries.
+    """
+    items_data = validated_data.pop('items')
+    with transaction.atomic():
+        products = reserve_stock(items_data)
+        items = []
+        for item_data in items_data:
+            product = products.get(item_data.get('product_id'))
+            if product is not None:
+                item_data = {**item_data, 'product_name': str(product), 'product_price': product.price}
+            items.append(OrderItem(
+                **item_data, total_price=item_data['product_price'] * item_data['quantity']
+            ))
+        validated_data['total_amount'] = sum(item.total_price for item in items)
+        order = Order.objects.create(**validated_data)
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+    order._prefetched_objects_cache = {'items': items}
+    return order
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
+    product_id = serializers.IntegerField(required=False, allow_null=True)
+
     class Meta:
         model = OrderItem
-        fields = ['product_name', 'product_price', 'quantity', 'total_price']
+        fields = ['product_id', 'product_name', 'product_price', 'quantity', 'total_price']
+        read_only_fields = ['total_price']
+        extra_kwargs = {
+            # Filled in from the product; only free-text items must send them
+            'product_name': {'required': False},
+            'product_price': {'required': False},
+        }
+
+    def validate(self, attrs):
+        if attrs.get('product_id') is not None:
+            return attrs
+        if not settings.ORDER_FREE_TEXT_ITEMS:
+            raise serializers.ValidationError({'product_id': 'This field is required.'})
+        missing = {
+            field: 'This field is required.'
+            for field in ('product_name', 'product_price') if field not in attrs
+        }
+        if missing:
+            raise serializers.ValidationError(missing)
+        return attrs
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -21,13 +81,7 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'status', 'created_at', 'updated_at']
 
     def create(self, validated_data):
-        items_data = validated_data.pop('items')
-        order = Order.objects.create(**validated_data)
-        
-        for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
-        
-        return order
+        return create_order_with_items(validated_data)
 
 
 class OrderCreateSerializer(serializers.Serializer):
@@ -43,10 +97,13 @@ class OrderCreateSerializer(serializers.Serializer):
     items = OrderItemSerializer(many=True)
 
     def create(self, validated_data):
-        items_data = validated_data.pop('items')
-        order = Order.objects.create(**validated_data)
-        
-        for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
-        
-        return order
+        return create_order_with_items(validated_data)
+
+
+class QuoteItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class QuoteRequestSerializer(serializers.Serializer):
+    items = QuoteItemSerializer(many=True, allow_empty=False, max_length=MAX_QUOTE_ITEMS)
@@ -0,0 +1,57 @@
+"""
+Stock reservation for checkout.
+
+Each product's stock is decremented with one conditional UPDATE
+(``SET stock_quantity = stock_quantity - n WHERE stock_quantity >= n``),
+so the check and the decrement are a single atomic statement and two
+concurrent checkouts can never both take the last unit. Must run inside
+the order's transaction: a rejected item rolls back every decrement.
+"""
+from collections import Counter
+
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import serializers
+
+from products.cache import invalidate_cache_tags, product_tag, PRODUCTS_TAG
+from products.models import Product
+
+
+def reserve_stock(items_data):
+    """
+    Take the quantities of ``product_id`` items out of stock and return the
+    reserved products by id, read after their rows were updated so their
+    prices are the ones the order is charged. Items without a product_id
+    (legacy free-text lines) are left alone. Raises ValidationError listing
+    every unavailable item.
+    """
+    quantities = Counter()
+    for item_data in items_data:
+        if item_data.get('product_id') is not None:
+            quantities[item_data['product_id']] += item_data['quantity']
+    if not quantities:
+        return {}
+
+    # Fixed lock order keeps concurrent multi-item checkouts from deadlocking
+    rejected = []
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        reserved = Product.objects.filter(
+            pk=product_id, is_active=True, stock_quantity__gte=quantity
+        ).update(stock_quantity=F('stock_quantity') - quantity, updated_at=timezone.now())
+        if not reserved:
+            rejected.append(product_id)
+
+    if rejected:
+        found = Product.objects.filter(is_active=True).in_bulk(rejected)
+        raise serializers.ValidationError({'items': [
+            f'Недостаточно товара на складе: {found[product_id]}.' if product_id in found
+            else f'Товар #{product_id} не найден.'
+            for product_id in rejected
+        ]})
+
+    # The UPDATEs above hold the rows until the order commits
+    products = Product.objects.in_bulk(list(quantities))
+    # update() sends no signals: expire cached catalog responses showing the old stock
+    invalidate_cache_tags(PRODUCTS_TAG, *(product_tag(product_id) for product_id in products))
+    return products
@@ -1,3 +1,196 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from products.models import Category, Product
+from .models import Order, OrderItem
+from .serializers import MAX_QUOTE_ITEMS
+
+
+class OrderCreateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Computers', slug='computers')
+        cls.pc = Product.objects.create(
+            name='PC', slug='pc', description='Test product', price='1000.00', category=category,
+            product_type='computer', brand='Brand', model='M1', stock_quantity=3,
+        )
+        cls.monitor = Product.objects.create(
+            name='Monitor', slug='monitor', description='Test product', price='250.00', category=category,
+            product_type='peripheral', brand='Brand', model='M2', stock_quantity=1,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def order(self, *items):
+        return {
+            'first_name': 'Ivan', 'last_name': 'Petrov', 'email': 'ivan@example.com', 'phone': '123',
+            'address': 'Street 1', 'city': 'Moscow', 'postal_code': '101000',
+            'items': list(items),
+        }
+
+    def stock(self):
+        return dict(Product.objects.values_list('slug', 'stock_quantity'))
+
+    def test_create_charges_catalog_prices(self):
+        data = self.order(
+            {'product_id': self.pc.id, 'product_name': 'Cheap', 'product_price': '1.00', 'quantity': 2},
+            {'product_id': self.monitor.id, 'quantity': 1},
+        )
+        data['total_amount'] = '3.00'
+        response = self.client.post('/api/orders/create-order/', data, format='json')
+        self.assertEqual(response.status_code, 201, response.json())
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, Decimal('2250.00'))
+        self.assertEqual(
+            list(order.items.order_by('id').values_list('product_name', 'product_price', 'total_price')),
+            [('Brand PC', Decimal('1000.00'), Decimal('2000.00')),
+             ('Brand Monitor', Decimal('250.00'), Decimal('250.00'))],
+        )
+        self.assertEqual(self.stock(), {'pc': 1, 'monitor': 0})
+
+    def test_oversell_conflict(self):
+        data = self.order({'product_id': self.pc.id, 'quantity': 4})
+        response = self.client.post('/api/orders/create-order/', data, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('items', response.json()['details'])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock(), {'pc': 3, 'monitor': 1})
+
+    def test_rejected_item_rolls_back_reserved_ones(self):
+        # The pc row is decremented first (lower id), then the monitor fails
+        data = self.order(
+            {'product_id': self.pc.id, 'quantity': 2},
+            {'product_id': self.monitor.id, 'quantity': 2},
+        )
+        response = self.client.post('/api/orders/orders/', data, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock(), {'pc': 3, 'monitor': 1})
+
+    def test_repeated_product_is_reserved_once(self):
+        data = self.order(
+            {'product_id': self.pc.id, 'quantity': 2},
+            {'product_id': self.pc.id, 'quantity': 2},
+        )
+        response = self.client.post('/api/orders/create-order/', data, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.stock(), {'pc': 3, 'monitor': 1})
+
+    def test_unknown_product(self):
+        data = self.order({'product_id': 999, 'quantity': 1})
+        response = self.client.post('/api/orders/create-order/', data, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    def test_free_text_item_rejected(self):
+        data = self.order({'product_name': 'Anything', 'product_price': '1.00', 'quantity': 1})
+        response = self.client.post('/api/orders/create-order/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('product_id', response.json()['details']['items'][0])
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(ORDER_FREE_TEXT_ITEMS=True)
+    def test_free_text_item_allowed(self):
+        data = self.order(
+            {'product_name': 'Assembly', 'product_price': '50.00', 'quantity': 2},
+            {'product_id': self.pc.id, 'quantity': 1},
+        )
+        response = self.client.post('/api/orders/create-order/', data, format='json')
+        self.assertEqual(response.status_code, 201, response.json())
+        self.assertEqual(Order.objects.get().total_amount, Decimal('1100.00'))
+        self.assertEqual(
+            OrderItem.objects.get(product__isnull=True).total_price, Decimal('100.00')
+        )
+        self.assertEqual(self.stock(), {'pc': 2, 'monitor': 1})
+
+    @override_settings(ORDER_FREE_TEXT_ITEMS=True)
+    def test_free_text_item_needs_name_and_price(self):
+        data = self.order({'product_name': 'Assembly', 'quantity': 1})
+        response = self.client.post('/api/orders/create-order/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('product_price', response.json()['details']['items'][0])
+
+
+class QuoteTests(TestCase):
+
+    url = '/api/orders/quote/'
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Computers', slug='computers')
+        cls.pc = Product.objects.create(
+            name='PC', slug='pc', description='Test product', price='1000.00', category=category,
+            product_type='computer', brand='Brand', model='M1', stock_quantity=3,
+        )
+        cls.monitor = Product.objects.create(
+            name='Monitor', slug='monitor', description='Test product', price='250.50', category=category,
+            product_type='peripheral', brand='Brand', model='M2', stock_quantity=1,
+        )
+        cls.hidden = Product.objects.create(
+            name='Hidden', slug='hidden', description='Test product', price='10.00', category=category,
+            product_type='other', brand='Brand', model='M3', stock_quantity=5, is_active=False,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def quote(self, *items):
+        return self.client.post(self.url, {'items': list(items)}, format='json')
+
+    def test_totals_from_catalog(self):
+        with self.assertNumQueries(1):
+            response = self.quote(
+                {'product_id': self.monitor.id, 'quantity': 1},
+                {'product_id': self.pc.id, 'quantity': 2},
+            )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([line['product_id'] for line in data['items']], [self.monitor.id, self.pc.id])
+        self.assertEqual(data['items'][1]['unit_price'], '1000.00')
+        self.assertEqual(data['items'][1]['line_total'], '2000.00')
+        self.assertEqual(data['total_amount'], '2250.50')
+        self.assertEqual(data['total_quantity'], 3)
+        self.assertTrue(data['available'])
+        self.assertEqual(data['missing'], [])
+
+    def test_repeated_product_merged(self):
+        data = self.quote(
+            {'product_id': self.pc.id, 'quantity': 1},
+            {'product_id': self.monitor.id, 'quantity': 1},
+            {'product_id': self.pc.id, 'quantity': 2},
+        ).json()
+        self.assertEqual([(line['product_id'], line['quantity']) for line in data['items']],
+                         [(self.pc.id, 3), (self.monitor.id, 1)])
+        self.assertEqual(data['total_amount'], '3250.50')
+
+    def test_availability(self):
+        data = self.quote(
+            {'product_id': self.pc.id, 'quantity': 3},
+            {'product_id': self.monitor.id, 'quantity': 2},
+        ).json()
+        self.assertEqual([line['available'] for line in data['items']], [True, False])
+        self.assertEqual(data['items'][1]['stock_quantity'], 1)
+        self.assertFalse(data['available'])
+
+    def test_missing_products(self):
+        data = self.quote(
+            {'product_id': self.pc.id, 'quantity': 1},
+            {'product_id': 999, 'quantity': 1},
+            {'product_id': self.hidden.id, 'quantity': 1},
+        ).json()
+        self.assertEqual(data['missing'], [999, self.hidden.id])
+        self.assertEqual([line['product_id'] for line in data['items']], [self.pc.id])
+        self.assertEqual(data['total_amount'], '1000.00')
+        self.assertFalse(data['available'])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.quote().status_code, 400)
+        self.assertEqual(self.quote({'product_id': self.pc.id, 'quantity': 0}).status_code, 400)
+        self.assertEqual(self.quote({'quantity': 1}).status_code, 400)
+        items = [{'product_id': self.pc.id, 'quantity': 1}] * (MAX_QUOTE_ITEMS + 1)
+        self.assertEqual(self.quote(*items).status_code, 400)
+        self.assertEqual(self.quote(*items[:MAX_QUOTE_ITEMS]).status_code, 200)
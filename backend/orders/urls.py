@@ -5,4 +5,5 @@ urlpatterns = [
     path('orders/', views.OrderCreateView.as_view(), name='order-create'),
     path('orders/<int:pk>/', views.OrderDetailView.as_view(), name='order-detail'),
     path('create-order/', views.create_order, name='create-order'),
+    path('quote/', views.quote_order, name='order-quote'),
 ]
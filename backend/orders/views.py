@@ -1,8 +1,10 @@
 from rest_framework import generics, status
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from .models import Order, OrderItem
-from .serializers import OrderSerializer, OrderCreateSerializer
+from .quote import build_quote
+from .serializers import OrderSerializer, OrderCreateSerializer, QuoteRequestSerializer
 
 
 class OrderCreateView(generics.CreateAPIView):
@@ -11,7 +13,10 @@ class OrderCreateView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            order = serializer.save()
+            try:
+                order = serializer.save()
+            except ValidationError as exc:
+                return Response(exc.detail, status=status.HTTP_409_CONFLICT)
             response_serializer = OrderSerializer(order)
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -27,7 +32,14 @@ def create_order(request):
     """Create a new order"""
     serializer = OrderCreateSerializer(data=request.data)
     if serializer.is_valid():
-        order = serializer.save()
+        try:
+            order = serializer.save()
+        except ValidationError as exc:
+            # Raised by the stock reservation, after validation
+            return Response({
+                'error': 'Some items are out of stock.',
+                'details': exc.detail
+            }, status=status.HTTP_409_CONFLICT)
         response_serializer = OrderSerializer(order)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     
@@ -43,4 +55,16 @@ def create_order(request):
     return Response({
         'error': error_message,
         'details': serializer.errors
-    }, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['POST'])
+def quote_order(request):
+    """Price a cart with current catalog prices and stock"""
+    serializer = QuoteRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'error': 'Invalid cart items.',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return Response(build_quote(serializer.validated_data['items']))
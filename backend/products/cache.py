@@ -0,0 +1,223 @@
+"""
+Tagged response cache for the catalog endpoints.
+
+Rendered responses are stored under a key built from the scheme, host,
+path, sorted query string and negotiated media type; serialized product
+snapshots are stored per slug. Each entry remembers the version of
+every tag it depends on (``product:<id>``, ``category:<id>``, ``user:<id>`` and the
+``products`` / ``categories`` collection tags). Model signals bump tag
+versions, so an entry goes stale as soon as anything it was built from
+changes. Only plain cache get/set calls are used, so any Django cache
+backend works, including local-memory and file-based ones.
+"""
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+
+PRODUCTS_TAG = 'products'
+CATEGORIES_TAG = 'categories'
+
+KEY_PREFIX = 'catalog'
+
+CACHED_HEADERS = ('ETag', 'Last-Modified')
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+def user_tag(user_id):
+    return f'user:{user_id}'
+
+
+def category_tag(category_id):
+    return f'category:{category_id}'
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _tag_key(tag):
+    return f'{KEY_PREFIX}:tag:{tag}'
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def _bump(tags):
+    get_cache().set_many({_tag_key(tag): _new_version() for tag in tags}, None)
+
+
+def invalidate_cache_tags(*tags):
+    """Expire every cached response that depends on any of ``tags``."""
+    if not tags:
+        return
+    _bump(tags)
+    # Bump again once the change is visible to other connections, otherwise a
+    # concurrent request could cache the pre-commit state under the new version
+    transaction.on_commit(lambda: _bump(tags))
+
+
+def add_cache_tags(request, *tags):
+    """
+    Mark the response being built for ``request`` as cacheable under ``tags``.
+
+    Views call this once they know what the response contains. Responses
+    that were never tagged (errors, private data) are not cached.
+    """
+    if not hasattr(request, 'cache_tags'):
+        request.cache_tags = set()
+    request.cache_tags.update(tags)
+
+
+def response_cache_key(request, vary_on_user=False):
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    audience = f'user:{request.user.pk}' if vary_on_user and request.user.is_authenticated else 'public'
+    # Bodies embed absolute media URLs, so http and https are cached apart
+    raw = '|'.join([
+        request.scheme, request.get_host(), request.path, query,
+        request.accepted_media_type, audience,
+    ])
+    return f'{KEY_PREFIX}:response:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def product_snapshot_key(request, slug):
+    # Serialized products embed absolute media URLs, hence the host
+    origin = f'{request.scheme}://{request.get_host()}'
+    return f'{KEY_PREFIX}:snapshot:{hashlib.md5(origin.encode()).hexdigest()}:{slug}'
+
+
+def product_compare_key(request, slugs):
+    # One entry per set of slugs, whatever order they were requested in
+    origin = f'{request.scheme}://{request.get_host()}'
+    raw = '|'.join([origin, *sorted(slugs)])
+    return f'{KEY_PREFIX}:compare:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def get_tagged(key):
+    """Return the value stored by set_tagged() if none of its tags changed since."""
+    cache = get_cache()
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    versions = cache.get_many([_tag_key(tag) for tag in entry['tags']])
+    for tag, version in entry['tags'].items():
+        if versions.get(_tag_key(tag)) != version:
+            return None
+    return entry['value']
+
+
+def tag_versions(tags):
+    """Current version of each of ``tags``, starting those never seen before."""
+    cache = get_cache()
+    tag_keys = {_tag_key(tag): tag for tag in tags}
+    versions = cache.get_many(list(tag_keys))
+    missing = {tag_key: _new_version() for tag_key in tag_keys if tag_key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return {tag: versions[tag_key] for tag_key, tag in tag_keys.items()}
+
+
+def set_tagged(key, value, tags, timeout=None):
+    """Store ``value`` under ``key`` until one of ``tags`` is invalidated."""
+    get_cache().set(key, {
+        'tags': tag_versions(tags),
+        'value': value,
+    }, settings.CATALOG_CACHE_TIMEOUT if timeout is None else timeout)
+
+
+def _make_response(entry):
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    for header, value in entry['headers'].items():
+        response[header] = value
+    return response
+
+
+def _cached(request, key):
+    entry = get_tagged(key)
+    if entry is None:
+        return None
+    response = _make_response(entry)
+    # Validators stored with the entry let a hit answer conditional GETs too
+    last_modified = response.get('Last-Modified')
+    return get_conditional_response(
+        request._request,
+        etag=response.get('ETag'),
+        last_modified=last_modified and parse_http_date_safe(last_modified),
+        response=response,
+    )
+
+
+def _store(request, key, response):
+    renderer = request.accepted_renderer
+    content = renderer.render(response.data, request.accepted_media_type, {'request': request})
+    if isinstance(content, str):
+        content = content.encode(renderer.charset)
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f'{content_type}; charset={renderer.charset}'
+
+    entry = {
+        'content': content,
+        'content_type': content_type,
+        'headers': {header: response[header] for header in CACHED_HEADERS if header in response},
+    }
+    set_tagged(key, entry, request.cache_tags)
+    return _make_response(entry)
+
+
+def serve_cached(request, build_response, vary_on_user=False):
+    """Return the cached response for ``request`` or build, cache and return it."""
+    # The browsable API embeds forms and per-user chrome, so only JSON is cached
+    if request.method not in ('GET', 'HEAD') or request.accepted_renderer.format != 'json':
+        return build_response()
+
+    key = response_cache_key(request, vary_on_user)
+    response = _cached(request, key)
+    if response is not None:
+        return response
+
+    response = build_response()
+    if response.status_code != 200 or response.streaming or not getattr(request, 'cache_tags', None):
+        return response
+    return _store(request, key, response)
+
+
+def cached_response(view_func=None, *, vary_on_user=False):
+    """Cache a function-based ``@api_view`` handler; apply below ``@api_view``."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(request, *args, **kwargs):
+            return serve_cached(
+                request, lambda: func(request, *args, **kwargs), vary_on_user
+            )
+        return wrapper
+
+    if view_func is not None:
+        return decorator(view_func)
+    return decorator
+
+
+class CachedResponseMixin:
+    """Cache GET responses of a generic view. ``cache_tags`` are always applied."""
+    cache_tags = ()
+    cache_vary_on_user = False
+
+    def get(self, request, *args, **kwargs):
+        def build_response():
+            add_cache_tags(request, *self.cache_tags)
+            return super(CachedResponseMixin, self).get(request, *args, **kwargs)
+
+        return serve_cached(request, build_response, self.cache_vary_on_user)
@@ -0,0 +1,32 @@
+"""
+Side-by-side product comparison.
+
+Product.specs holds a copy of each product's specifications, so comparing
+products costs one query for the products themselves; the aligned matrix is
+built here in Python from those lists.
+"""
+
+
+def spec_matrix(spec_lists):
+    """
+    Align the specifications of several products.
+
+    ``spec_lists`` holds one Product.specs list per compared product. Returns
+    one row per specification name, in order of first appearance, with the
+    value of each product (``None`` where a product lacks it) and whether the
+    values differ. Repeated names within one product are joined with ", ".
+    """
+    names = {}
+    columns = []
+    for specs in spec_lists:
+        column = {}
+        for spec in specs:
+            names.setdefault(spec['name'], None)
+            column.setdefault(spec['name'], []).append(spec['value'])
+        columns.append({name: ', '.join(values) for name, values in column.items()})
+
+    rows = []
+    for name in names:
+        values = [column.get(name) for column in columns]
+        rows.append({'name': name, 'values': values, 'differs': len(set(values)) > 1})
+    return rows
@@ -0,0 +1,56 @@
+"""
+Conditional GET (ETag / Last-Modified) for the catalog views.
+
+Validators come from cheap lookups (a single-row query, or the cache tag
+versions for lists), so a client that already has the current
+representation gets a 304 without running the serializers.
+Listed after CachedResponseMixin, the validators are stored with cached
+entries and cache hits answer conditional requests without any query.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def fingerprint(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+class ConditionalGetMixin:
+    """
+    Answers If-None-Match / If-Modified-Since for GET requests.
+
+    Views implement get_validators() returning ``(etag, last_modified)``,
+    where last_modified is a datetime; either may be None. Returning
+    ``(None, None)`` disables conditional handling for the request.
+    """
+
+    def get_validators(self, request, *args, **kwargs):
+        return None, None
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, *args, **kwargs)
+        if etag is not None:
+            etag = quote_etag(etag)
+        if last_modified is not None:
+            last_modified = int(last_modified.timestamp())
+
+        if etag is not None or last_modified is not None:
+            not_modified = get_conditional_response(
+                request._request, etag=etag, last_modified=last_modified
+            )
+            if not_modified is not None:
+                return self._set_validators(not_modified, etag, last_modified)
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            self._set_validators(response, etag, last_modified)
+        return response
+
+    def _set_validators(self, response, etag, last_modified):
+        if etag is not None:
+            response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
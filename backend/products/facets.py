@@ -0,0 +1,79 @@
+"""
+Facet counts for the catalog filter sidebar.
+
+Counts are disjunctive: each facet is counted over the products matching
+every applied filter except its own, so the sidebar keeps offering the
+other brands (categories, ...) while one is selected. Each facet is one
+grouped query, and the price buckets are counted together in a single
+aggregate, so a request costs five queries whatever the catalog size.
+"""
+from django.conf import settings
+from django.db.models import Count, Q
+from django_filters.utils import translate_validation
+
+from .filters import ProductFilter
+from .models import Product
+
+# Facet -> the ProductFilter filters that select on it
+FACET_FILTERS = {
+    'category': ('category', 'category__in'),
+    'product_type': ('product_type', 'product_type__in'),
+    'brand': ('brand', 'brand__in'),
+    'price': ('price__gte', 'price__lte'),
+}
+
+
+def price_buckets():
+    """``(min, max)`` ranges between settings.PRODUCT_PRICE_BUCKETS edges, open-ended at the top."""
+    edges = [0, *settings.PRODUCT_PRICE_BUCKETS]
+    return list(zip(edges, [*edges[1:], None]))
+
+
+def compute_facets(queryset, params, request=None):
+    filterset = ProductFilter(params, queryset=queryset, request=request)
+    if not filterset.is_valid():
+        raise translate_validation(filterset.errors)
+    values = {
+        name: value for name, value in filterset.form.cleaned_data.items()
+        if value not in (None, '', [])
+    }
+
+    def filtered(facet=None):
+        excluded = FACET_FILTERS.get(facet, ())
+        result = queryset
+        for name, value in values.items():
+            if name not in excluded:
+                result = filterset.filters[name].filter(result, value)
+        return result.order_by()
+
+    type_labels = dict(Product.PRODUCT_TYPES)
+    buckets = price_buckets()
+    price_counts = filtered('price').aggregate(**{
+        f'bucket_{i}': Count('id', filter=Q(price__gte=low) & (Q(price__lt=high) if high else Q()))
+        for i, (low, high) in enumerate(buckets)
+    })
+
+    return {
+        'total': filtered().count(),
+        'category': [
+            {'id': row['category'], 'name': row['category__name'],
+             'slug': row['category__slug'], 'count': row['count']}
+            for row in filtered('category').values('category', 'category__name', 'category__slug')
+            .annotate(count=Count('id')).order_by('category__name')
+        ],
+        'product_type': [
+            {'value': row['product_type'], 'label': type_labels.get(row['product_type'], row['product_type']),
+             'count': row['count']}
+            for row in filtered('product_type').values('product_type')
+            .annotate(count=Count('id')).order_by('-count', 'product_type')
+        ],
+        'brand': [
+            {'value': row['brand'], 'count': row['count']}
+            for row in filtered('brand').values('brand')
+            .annotate(count=Count('id')).order_by('-count', 'brand')
+        ],
+        'price': [
+            {'min': low, 'max': high, 'count': price_counts[f'bucket_{i}']}
+            for i, (low, high) in enumerate(buckets)
+        ],
+    }
@@ -0,0 +1,53 @@
+"""
+Sparse fieldsets (``?fields=`` / ``?omit=``) for the product views.
+
+Both parameters take comma-separated top-level field names. Dropped fields
+are removed from the serializer before serialization and the queryset is
+narrowed with only(), so unused columns, joins and prefetches are skipped.
+"""
+from rest_framework.exceptions import ValidationError
+
+
+def _field_names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class SparseFieldsetMixin:
+    """
+    For views whose serializer uses SparseFieldsMixin. Views list the model
+    paths they read themselves (cache tags, permission checks, pagination)
+    in get_required_fields(), so narrowing never defers them.
+    """
+
+    def get_sparse_fieldset(self):
+        if not hasattr(self, '_sparse_fieldset'):
+            params = self.request.query_params
+            fieldset = {}
+            if params.get('fields'):
+                fieldset['fields'] = _field_names(params['fields'])
+            if params.get('omit'):
+                fieldset['omit'] = _field_names(params['omit'])
+            if fieldset:
+                known = self.get_serializer_class()().fields
+                unknown = sorted({
+                    name for names in fieldset.values() for name in names if name not in known
+                })
+                if unknown:
+                    raise ValidationError({'error': f"Неизвестные поля: {', '.join(unknown)}."})
+            self._sparse_fieldset = fieldset
+        return self._sparse_fieldset
+
+    def get_required_fields(self):
+        return []
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(self.get_sparse_fieldset())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fieldset = self.get_sparse_fieldset()
+        if not fieldset:
+            return queryset
+        serializer = self.get_serializer_class()(**fieldset)
+        return serializer.narrow_queryset(queryset, self.get_required_fields())
@@ -0,0 +1,75 @@
+import re
+
+from django import forms
+from django_filters import rest_framework as filters
+from django_filters.widgets import QueryArrayWidget
+
+from .models import Product, ProductSpecification
+
+# "<name>:<value>" matches the value exactly, "<name>~<text>" a value containing text
+SPEC_CONDITION = re.compile(r'^(?P<name>[^:~]+)(?P<op>[:~])(?P<value>.+)$')
+
+
+class CharInFilter(filters.BaseInFilter, filters.CharFilter):
+    pass
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+
+class SpecConditionsField(forms.Field):
+    widget = QueryArrayWidget
+
+    def to_python(self, value):
+        conditions = []
+        for raw in value or []:
+            match = SPEC_CONDITION.match(raw)
+            if match is None or not match['name'].strip() or not match['value'].strip():
+                raise forms.ValidationError(
+                    "Ожидается «характеристика:значение» или «характеристика~текст»: %(raw)s",
+                    params={'raw': raw},
+                )
+            conditions.append((match['name'].strip(), match['op'], match['value'].strip()))
+        return conditions
+
+
+class SpecFilter(filters.Filter):
+    """
+    Filters on specifications: ``?spec=Память:32GB DDR5&spec=Процессор~i7``.
+
+    Each condition is a lookup in the (name, value, product) index of
+    ProductSpecification, which yields the ids of the matching products
+    (its posting list); the conditions are ANDed by intersecting those
+    lists, without joining the specifications table once per condition.
+    """
+    field_class = SpecConditionsField
+
+    def filter(self, qs, value):
+        for name, op, text in value or ():
+            lookup = {'value': text} if op == ':' else {'value__icontains': text}
+            postings = ProductSpecification.objects.filter(name=name, **lookup).values('product_id')
+            qs = qs.filter(id__in=postings)
+        return qs
+
+
+class ProductFilter(filters.FilterSet):
+    """
+    Catalog filters: exact and comma-separated multi-value lookups
+    (``brand__in=ASUS,MSI``) on category, product type and brand, plus a
+    price range (``price__gte`` / ``price__lte``) and specification
+    conditions (``spec``, see SpecFilter).
+    """
+    spec = SpecFilter()
+    category__in = NumberInFilter(field_name='category')
+    product_type__in = CharInFilter(field_name='product_type')
+    brand__in = CharInFilter(field_name='brand')
+
+    class Meta:
+        model = Product
+        fields = {
+            'category': ['exact'],
+            'product_type': ['exact'],
+            'brand': ['exact'],
+            'price': ['gte', 'lte'],
+        }
@@ -0,0 +1,167 @@
+"""
+Responsive derivatives of product and category images.
+
+Once a save that changes ``image`` commits, the image is re-encoded at each
+of settings.IMAGE_DERIVATIVE_WIDTHS (never upscaled) in every format of
+settings.IMAGE_DERIVATIVE_FORMATS. The files are stored next to the original
+(``products/x.png`` -> ``products/x.320w.webp``), and the model's
+``image_variants`` column records them:
+
+    {"source": "products/x.png",
+     "formats": {"image/webp": {"320": "products/x.320w.webp", ...}, ...}}
+
+``source`` ties the record to the image it was built from, so derivatives
+of a replaced image are never served. A source file that does not exist is
+recorded with ``"missing": true`` and no formats, and is not retried until
+the image changes. The work runs in a small thread pool
+off the request path (settings.IMAGE_DERIVATIVES_BACKGROUND).
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import invalidate_cache_tags
+
+logger = logging.getLogger(__name__)
+
+# Format -> (MIME type, file extension, Pillow save options)
+FORMATS = {
+    'webp': ('image/webp', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('image/jpeg', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_DERIVATIVE_WORKERS, thread_name_prefix='image-derivatives'
+        )
+    return _executor
+
+
+def needs_derivatives(instance):
+    """Whether ``image_variants`` was built from another image than the current one."""
+    return (instance.image_variants or {}).get('source') != (instance.image.name or None)
+
+
+def schedule_derivatives(instance, tags):
+    """Rebuild the derivatives of ``instance`` once the current transaction commits."""
+    model, pk = type(instance), instance.pk
+
+    def run():
+        if settings.IMAGE_DERIVATIVES_BACKGROUND:
+            _get_executor().submit(_update_derivatives_logged, model, pk, tags)
+        else:
+            update_derivatives(model, pk, tags)
+
+    transaction.on_commit(run)
+
+
+def _update_derivatives_logged(model, pk, tags):
+    # Pool threads outlive requests: give each job a usable connection and
+    # do not leave it open behind
+    close_old_connections()
+    try:
+        update_derivatives(model, pk, tags)
+    except Exception:
+        logger.exception('Image derivatives failed for %s %s', model._meta.label, pk)
+    finally:
+        close_old_connections()
+
+
+def update_derivatives(model, pk, tags=()):
+    """
+    Render the derivatives of the current image of ``model`` row ``pk`` and
+    record them, dropping those of the image it replaced. ``tags`` are the
+    cache tags to invalidate once the new variants are visible.
+    """
+    instance = model._default_manager.filter(pk=pk).only('image', 'image_variants').first()
+    if instance is None:
+        return
+    old = instance.image_variants or {}
+    source = instance.image.name or None
+    variants = {}
+    if source:
+        try:
+            variants = {'source': source, 'formats': render_derivatives(instance.image)}
+        except FileNotFoundError:
+            # Recorded against the source, so saves do not retry until the image changes
+            logger.warning('Image %s of %s %s is missing, no derivatives rendered',
+                           source, model._meta.label, pk)
+            variants = {'source': source, 'formats': {}, 'missing': True}
+
+    # Write only if the image is still the one rendered; a newer save has its own job
+    current = Q(image=source) if source else Q(image='') | Q(image__isnull=True)
+    updated = model._default_manager.filter(current, pk=pk).update(
+        image_variants=variants, updated_at=timezone.now()
+    )
+    keep = variant_names(variants) if updated else set()
+    for name in (variant_names(old) | variant_names(variants)) - keep:
+        instance.image.storage.delete(name)
+    if updated:
+        invalidate_cache_tags(*tags)
+
+
+def variant_names(variants):
+    return {name for sizes in (variants or {}).get('formats', {}).values() for name in sizes.values()}
+
+
+def derivative_name(name, width, extension):
+    root, _ = os.path.splitext(name)
+    return f'{root}.{width}w.{extension}'
+
+
+def render_derivatives(file):
+    """Encode and store the derivatives of ``file``; returns the ``formats`` map."""
+    storage = file.storage
+    with file.open('rb'):
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    widths = sorted({width for width in settings.IMAGE_DERIVATIVE_WIDTHS if width < image.width})
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    formats = {}
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        scaled = image.resize((width, height), Image.Resampling.LANCZOS)
+        for format_name in settings.IMAGE_DERIVATIVE_FORMATS:
+            mime, extension, options = FORMATS[format_name]
+            encoded = scaled
+            if format_name == 'jpeg' and scaled.mode == 'RGBA':
+                # JPEG has no alpha channel: flatten onto white
+                encoded = Image.new('RGB', scaled.size, (255, 255, 255))
+                encoded.paste(scaled, mask=scaled.getchannel('A'))
+            buffer = io.BytesIO()
+            encoded.save(buffer, format=format_name.upper(), **options)
+            name = derivative_name(file.name, width, extension)
+            formats.setdefault(mime, {})[str(width)] = storage.save(name, ContentFile(buffer.getvalue()))
+    return formats
+
+
+def image_srcset(file, variants, url):
+    """
+    ``{mime type: srcset}`` for the derivatives of ``file`` (``None`` until
+    they are built), ready for ``<source type=... srcset=...>``. ``url``
+    turns a storage name into the URL to emit.
+    """
+    if not file or not variants or variants.get('source') != file.name:
+        return None
+    return {
+        mime: ', '.join(f'{url(name)} {width}w' for width, name in sorted(sizes.items(), key=lambda s: int(s[0])))
+        for mime, sizes in variants['formats'].items()
+        if sizes
+    } or None
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_active_products(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    Product = apps.get_model('products', 'Product')
+    CategoryProductCount = apps.get_model('products', 'CategoryProductCount')
+    counts = dict(
+        Product.objects.filter(is_active=True)
+        .order_by()
+        .values_list('category')
+        .annotate(count=Count('pk'))
+    )
+    CategoryProductCount.objects.bulk_create([
+        CategoryProductCount(category_id=pk, active_products=counts.get(pk, 0))
+        for pk in Category.objects.values_list('pk', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryProductCount',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='product_count_row', serialize=False, to='products.category')),
+                ('active_products', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_active_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productspecification',
+            index=models.Index(fields=['name', 'value', 'product'], name='spec_name_value_product_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:29
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def copy_specifications(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductSpecification = apps.get_model('products', 'ProductSpecification')
+    specs = defaultdict(list)
+    for product_id, name, value in ProductSpecification.objects.order_by('product_id', 'id').values_list(
+        'product_id', 'name', 'value'
+    ):
+        specs[product_id].append({'name': name, 'value': value})
+    products = list(Product.objects.filter(pk__in=list(specs)).only('pk'))
+    for product in products:
+        product.specs = specs[product.pk]
+    Product.objects.bulk_update(products, ['specs'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_specification_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='specs',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(copy_specifications, migrations.RunPython.noop),
+    ]
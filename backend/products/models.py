@@ -3,14 +3,41 @@ from django.core.validators import MinValueValidator
 from django.contrib.auth.models import User
 
 
-class Category(models.Model):
+class DerivedFieldsModel(models.Model):
+    """
+    Columns in ``derived_fields`` are copies maintained by products.signals
+    and products.images with queryset updates. save() of an existing row
+    leaves them out, so an instance loaded before they changed cannot write
+    back its stale copy; new rows still insert them.
+    """
+    derived_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.derived_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class Category(DerivedFieldsModel):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    # Resized copies of `image`, maintained by products.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    derived_fields = ('image_variants',)
+
     class Meta:
         verbose_name_plural = "Categories"
         ordering = ['name']
@@ -19,7 +46,16 @@ class Category(models.Model):
         return self.name
 
 
-class Product(models.Model):
+class CategoryProductCount(models.Model):
+    """Number of active products per category, maintained by products.signals."""
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='product_count_row')
+    active_products = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.category.name}: {self.active_products}"
+
+
+class Product(DerivedFieldsModel):
     PRODUCT_TYPES = [
         ('computer', 'Computer'),
         ('all-in-one', 'All-in-One'),
@@ -37,14 +73,52 @@ class Product(models.Model):
     brand = models.CharField(max_length=100)
     model = models.CharField(max_length=100)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Resized copies of `image`, maintained by products.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     stock_quantity = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
+    # [{"name": ..., "value": ...}] copy of the specifications, maintained by products.signals
+    specs = models.JSONField(default=list, blank=True, editable=False)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_products')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    derived_fields = ('image_variants', 'specs')
+
     class Meta:
         ordering = ['-created_at']
+        # Catalog reads only ever see active products, so the list indexes
+        # are partial: they skip inactive rows and match `is_active` filters.
+        # Each one ends in the sort key the catalog pages on (with the id as
+        # the cursor tie-breaker), so a page is an ordered index walk.
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-id'], name='product_active_created_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['price', 'id'], name='product_active_price_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['name', 'id'], name='product_active_name_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['category', '-created_at'], name='product_active_category_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['product_type', '-created_at'], name='product_active_type_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['brand', '-created_at'], name='product_active_brand_idx',
+                condition=models.Q(is_active=True),
+            ),
+            # Per-category active counts (product_categories) from the index alone
+            models.Index(fields=['category', 'is_active'], name='product_category_active_idx'),
+        ]
 
     def __str__(self):
         return f"{self.brand} {self.name}"
@@ -59,5 +133,12 @@ class ProductSpecification(models.Model):
     name = models.CharField(max_length=100)
     value = models.CharField(max_length=200)
 
+    class Meta:
+        indexes = [
+            # Inverted index for spec filters: (name, value) -> product ids,
+            # read from the index alone (see products.filters.SpecFilter)
+            models.Index(fields=['name', 'value', 'product'], name='spec_name_value_product_idx'),
+        ]
+
     def __str__(self):
         return f"{self.product.name} - {self.name}: {self.value}"
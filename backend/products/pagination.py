@@ -1,8 +1,209 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _reverse(order):
+    return order[1:] if order.startswith('-') else '-' + order
+
+
+class ProductCursorPagination(BasePagination):
+    """
+    Keyset pagination over the active ordering plus the primary key.
+
+    The cursor stores the (ordering value, id) of the boundary row, so a page
+    is a single indexed range scan with LIMIT: there is no COUNT(*) and no
+    OFFSET, and rows inserted while a client walks the catalog never shift
+    the pages it has yet to read.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    default_ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.evaluate_page(*self.get_page_queryset(queryset, request))
+
+    def evaluate_page(self, page_queryset, position, reverse):
+        results = list(page_queryset)
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+        self.set_page(results, position, reverse, has_more)
+        return results
+
+    def stream_page(self, queryset, request, view=None, chunk_size=100):
+        """
+        Lazy counterpart of paginate_queryset() for streaming responses.
+
+        Returns ``(head, rows, tail)``: the envelope keys known up front, an
+        iterator over the page rows, and a callable returning the keys that
+        are only known once ``rows`` is exhausted (the links).
+        """
+        page_queryset, position, reverse = self.get_page_queryset(queryset, request)
+        if reverse:
+            # A previous page is read backwards and must be flipped: buffer it
+            return {}, iter(self.evaluate_page(page_queryset, position, reverse)), self.get_links
+
+        def rows():
+            first = last = None
+            has_more = False
+            for count, instance in enumerate(page_queryset.iterator(chunk_size=chunk_size)):
+                if count == self.page_size:
+                    # The extra row only tells whether there is a next page
+                    has_more = True
+                    break
+                if first is None:
+                    first = instance
+                last = instance
+                yield instance
+            # The links only need the boundary rows
+            self.set_page([first, last] if first else [], position, reverse, has_more)
+
+        return {}, rows(), self.get_links
+
+    def get_page_queryset(self, queryset, request):
+        """The ordered, cursor-filtered queryset of the page plus one row."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        order = self.get_order(queryset)
+        self.order_field = order.lstrip('-')
+        self.ordering = (order, '-id' if order.startswith('-') else 'id')
+
+        position, reverse = self.decode_cursor(request, queryset)
+        ordering = [_reverse(o) for o in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            value, pk = position
+            lookup = 'lt' if ordering[0].startswith('-') else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.order_field}__{lookup}': value})
+                | Q(**{self.order_field: value, f'id__{lookup}': pk})
+            )
+
+        return queryset[:self.page_size + 1], position, reverse
+
+    def set_page(self, results, position, reverse, has_more):
+        if reverse:
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_order(self, queryset):
+        """First term of the ordering applied by the filter backends."""
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return ordering[0] if ordering else self.default_ordering
+
+    def get_order_field(self, queryset):
+        if self.order_field in queryset.query.annotations:
+            return queryset.query.annotations[self.order_field].output_field
+        try:
+            return queryset.model._meta.get_field(self.order_field)
+        except FieldDoesNotExist:
+            raise NotFound(self.invalid_cursor_message)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            token = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if token['o'] != self.ordering[0]:
+                raise ValueError('cursor belongs to a different ordering')
+            value, pk = token['p']
+            value = self.get_order_field(queryset).to_python(value)
+            return (value, int(pk)), bool(token.get('r'))
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        value = getattr(instance, self.order_field)
+        token = {
+            'o': self.ordering[0],
+            'p': [value.isoformat() if hasattr(value, 'isoformat') else str(value), instance.pk],
+        }
+        if reverse:
+            token['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(token).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return replace_query_param(self.base_url, self.cursor_query_param, '')
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_links(self):
+        return {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+
+    def get_paginated_response(self, data):
+        return Response({**self.get_links(), 'results': data})
 
 
 class ProductPagination(PageNumberPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 1000
+    cursor_class = ProductCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # ?cursor= (even empty) switches to keyset mode: no COUNT(*) and no OFFSET
+        self.cursor_paginator = None
+        if self.cursor_class.cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def stream_page(self, queryset, request, view=None, chunk_size=100):
+        """See ProductCursorPagination.stream_page(); page mode knows every key up front."""
+        if self.cursor_class.cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_class()
+            return self.cursor_paginator.stream_page(queryset, request, view, chunk_size)
+
+        self.cursor_paginator = None
+        self.request = request
+        paginator = self.django_paginator_class(queryset, self.get_page_size(request))
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        head = {
+            'count': paginator.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+        return head, self.page.object_list.iterator(chunk_size=chunk_size), lambda: {}
 
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,171 @@
+"""
+Full-text search for the product catalog.
+
+On SQLite the catalog is indexed by an external-content FTS5 table that
+triggers keep in sync with products_product. On PostgreSQL a GIN index
+over a tsvector expression is used instead. Any other backend falls back
+to DRF's regular icontains search.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+
+PRODUCT_TABLE = 'products_product'
+FTS_TABLE = 'products_product_fts'
+SEARCH_RANK = 'search_rank'
+
+# Columns in the index and their bm25 weights (a hit in the name counts most)
+SEARCH_COLUMNS = ['name', 'description', 'brand', 'model']
+SEARCH_WEIGHTS = [10.0, 1.0, 5.0, 5.0]
+
+PG_INDEX_NAME = 'products_product_search_gin'
+PG_DOCUMENT = (
+    "to_tsvector('simple', "
+    "coalesce({t}name, '') || ' ' || coalesce({t}description, '') || ' ' || "
+    "coalesce({t}brand, '') || ' ' || coalesce({t}model, ''))"
+)
+
+_columns = ', '.join(SEARCH_COLUMNS)
+_new_values = ', '.join(f'new.{column}' for column in SEARCH_COLUMNS)
+_old_values = ', '.join(f'old.{column}' for column in SEARCH_COLUMNS)
+
+SQLITE_CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"{_columns}, content='{PRODUCT_TABLE}', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+SQLITE_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {PRODUCT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {PRODUCT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) "
+    f"VALUES ('delete', old.id, {_old_values}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_columns} ON {PRODUCT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) "
+    f"VALUES ('delete', old.id, {_old_values}); "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); END",
+]
+
+_TOKEN_RE = re.compile(r'\w+')
+
+# Aliases whose search index has already been seen in place
+_ready_aliases = set()
+
+
+def install_search_index(connection):
+    """
+    Create the full-text index for the connection's backend if it is missing.
+
+    Safe to call repeatedly. On SQLite the triggers are recreated as well,
+    because rebuilding products_product (as some ALTER TABLE migrations do)
+    silently drops them.
+    """
+    tables = connection.introspection.table_names()
+    if PRODUCT_TABLE not in tables:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            if FTS_TABLE not in tables:
+                cursor.execute(SQLITE_CREATE_TABLE)
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            for statement in SQLITE_TRIGGERS:
+                cursor.execute(statement)
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {PG_INDEX_NAME} ON {PRODUCT_TABLE} "
+                f"USING gin (({PG_DOCUMENT.format(t='')}))"
+            )
+
+
+def uninstall_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f"DROP INDEX IF EXISTS {PG_INDEX_NAME}")
+    _ready_aliases.discard(connection.alias)
+
+
+def search_backend(alias):
+    """Return 'sqlite' or 'postgresql' if a full-text index can serve queries on this alias."""
+    connection = connections[alias]
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor != 'sqlite':
+        return None
+    if alias not in _ready_aliases:
+        if FTS_TABLE not in connection.introspection.table_names():
+            return None
+        _ready_aliases.add(alias)
+    return 'sqlite'
+
+
+def search_tokens(terms):
+    """Split search terms into word tokens the same way the index tokenizer does."""
+    return _TOKEN_RE.findall(' '.join(terms).lower())
+
+
+def apply_search(queryset, tokens):
+    """
+    Restrict the queryset to products matching every token (as a prefix)
+    and annotate it with a relevance score, higher is better.
+    """
+    backend = search_backend(queryset.db)
+    if backend == 'sqlite':
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+        matching_ids = RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,)
+        )
+        rank = RawSQL(
+            f"SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = {PRODUCT_TABLE}.id",
+            (match,),
+            output_field=FloatField(),
+        )
+        return queryset.filter(id__in=matching_ids).annotate(**{SEARCH_RANK: rank})
+
+    document = PG_DOCUMENT.format(t=f'{PRODUCT_TABLE}.')
+    tsquery = ' & '.join(f'{token}:*' for token in tokens)
+    matches = RawSQL(
+        f"{document} @@ to_tsquery('simple', %s)", (tsquery,), output_field=BooleanField()
+    )
+    rank = RawSQL(
+        f"ts_rank({document}, to_tsquery('simple', %s))", (tsquery,), output_field=FloatField()
+    )
+    return queryset.filter(matches).annotate(**{SEARCH_RANK: rank})
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    ?search= backed by the full-text index. Falls back to the stock
+    icontains search on backends without one.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        if search_backend(queryset.db) is None:
+            return super().filter_queryset(request, queryset, view)
+
+        tokens = search_tokens(search_terms)
+        if not tokens:
+            return queryset.none()
+        return apply_search(queryset, tokens)
+
+
+class ProductOrderingFilter(filters.OrderingFilter):
+    """Orders search results by relevance unless ?ordering= is given explicitly."""
+
+    def get_ordering(self, request, queryset, view):
+        if (SEARCH_RANK in queryset.query.annotations
+                and not request.query_params.get(self.ordering_param)):
+            return ['-' + SEARCH_RANK, *(self.get_default_ordering(view) or [])]
+        return super().get_ordering(request, queryset, view)
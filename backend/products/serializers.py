@@ -1,6 +1,160 @@
+from operator import attrgetter
+
 from rest_framework import serializers
-from django.utils.text import slugify
+from rest_framework.settings import api_settings
+from django.db import models
+from django.utils.encoding import iri_to_uri
+from .images import image_srcset
 from .models import Category, Product, ProductSpecification
+from .slugs import save_with_unique_slug
+
+
+def absolute_uri(request, url):
+    """
+    request.build_absolute_uri() for root-relative URLs, with the scheme and
+    host resolved once per request instead of once per call.
+    """
+    if not url.startswith('/') or url.startswith('//') or '/./' in url or '/../' in url:
+        return request.build_absolute_uri(url)
+    prefix = getattr(request, '_absolute_uri_prefix', None)
+    if prefix is None:
+        prefix = request._absolute_uri_prefix = f'{request.scheme}://{request.get_host()}'
+    return prefix + iri_to_uri(url)
+
+
+# Fields whose to_representation() is the identity for the values the ORM returns
+PASSTHROUGH_FIELDS = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+    serializers.ChoiceField, serializers.ReadOnlyField,
+)
+
+
+class CompiledListSerializer(serializers.ListSerializer):
+    """
+    Serializes many objects through readers compiled once per call.
+
+    DRF dispatches every field of every row through get_attribute() and
+    to_representation(); for large pages that dominates the response time.
+    Here each field is turned into a single callable up front (a plain
+    attrgetter where the output equals the model value) and nested
+    foreign-key serializers are evaluated once per related object.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        readers = self.child.compile_readers()
+        return [{name: read(instance) for name, read in readers} for instance in iterable]
+
+
+class CompiledReadersMixin:
+    """Builds the per-field readers used by CompiledListSerializer."""
+
+    def compile_readers(self):
+        self._file_urls = {}
+        return [(field.field_name, self.compile_reader(field)) for field in self._readable_fields]
+
+    def compile_reader(self, field):
+        # Serializers can supply their own reader with a compile_<field name>() method
+        hook = getattr(self, f'compile_{field.field_name}', None)
+        if hook is not None:
+            return hook(field)
+        if isinstance(field, serializers.SerializerMethodField):
+            return getattr(self, field.method_name)
+        if len(field.source_attrs) != 1:
+            return self._generic_reader(field)
+
+        source = field.source
+        if isinstance(field, serializers.ModelSerializer):
+            return self._related_reader(field, source)
+        if isinstance(field, serializers.FileField):
+            return self._file_reader(field, source)
+        if type(field) in PASSTHROUGH_FIELDS or isinstance(field, serializers.CharField):
+            return attrgetter(source)
+        return self._generic_reader(field)
+
+    def _generic_reader(self, field):
+        def read(instance):
+            attribute = field.get_attribute(instance)
+            return None if attribute is None else field.to_representation(attribute)
+        return read
+
+    def _related_reader(self, field, source):
+        # Many rows share a category: serialize each related object only once
+        attname = self.Meta.model._meta.get_field(source).attname
+        memo = {}
+
+        def read(instance):
+            key = getattr(instance, attname)
+            if key not in memo:
+                related = getattr(instance, source)
+                memo[key] = None if related is None else field.to_representation(related)
+            return memo[key]
+        return read
+
+    def _file_reader(self, field, source):
+        if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+            return self._generic_reader(field)
+
+        def read(instance):
+            value = getattr(instance, source)
+            return self._file_url(value) if value else None
+        return read
+
+    def _file_url(self, file):
+        """URL of a stored file as FileField renders it, memoized per file name."""
+        url = self._file_urls.get(file.name)
+        if url is None:
+            url = file.url
+            request = self.context.get('request')
+            if request is not None:
+                url = absolute_uri(request, url)
+            self._file_urls[file.name] = url
+        return url
+
+
+class SparseFieldsMixin:
+    """
+    Keeps only the ``fields`` or drops the ``omit`` top-level fields passed
+    to the constructor, and narrows querysets to what the kept fields read.
+
+    ``field_sources`` maps fields that do not read a model field of their
+    own name (method fields, properties) to the model paths they use.
+    """
+    field_sources = {}
+
+    def __init__(self, *args, fields=None, omit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in omit or ():
+            self.fields.pop(name, None)
+
+    def narrow_queryset(self, queryset, required=()):
+        """
+        Restrict ``queryset`` to the columns of the kept fields (plus
+        ``required`` model paths the caller reads itself), joining and
+        prefetching only the relations they still need.
+        """
+        columns = {queryset.model._meta.pk.name, *required}
+        prefetch = set()
+        for field in self.fields.values():
+            if field.field_name in self.field_sources:
+                columns.update(self.field_sources[field.field_name])
+            elif isinstance(field, serializers.ListSerializer):
+                prefetch.add(field.source)
+            elif isinstance(field, serializers.ModelSerializer):
+                columns.update(f'{field.source}__{nested.source}' for nested in field.fields.values())
+            else:
+                columns.add(field.source)
+
+        related = {path.split('__')[0] for path in columns if '__' in path}
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset.only(*columns, *related)
 
 
 class ProductSpecificationSerializer(serializers.ModelSerializer):
@@ -15,17 +169,27 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'description', 'image']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
-    specifications = ProductSpecificationSerializer(many=True, read_only=True)
+    # Same [{name, value}] list as ProductSpecificationSerializer, read from
+    # the denormalized column instead of a query on the specifications table
+    specifications = serializers.JSONField(source='specs', read_only=True)
     image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     created_by = serializers.SerializerMethodField()
+    field_sources = {
+        'specifications': ['specs'],
+        'image_url': ['image'],
+        'image_srcset': ['image', 'image_variants'],
+        'is_in_stock': ['stock_quantity'],
+        'created_by': ['created_by__id', 'created_by__username'],
+    }
     
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'slug', 'description', 'price', 'category',
-            'product_type', 'brand', 'model', 'image', 'image_url',
+            'product_type', 'brand', 'model', 'image', 'image_url', 'image_srcset',
             'stock_quantity', 'is_active', 'is_in_stock', 'specifications',
             'created_by', 'created_at', 'updated_at'
         ]
@@ -42,29 +206,67 @@ class ProductSerializer(serializers.ModelSerializer):
         if obj.image:
             request = self.context.get('request')
             if request:
-                return request.build_absolute_uri(obj.image.url)
+                return absolute_uri(request, obj.image.url)
         return None
 
+    def get_image_srcset(self, obj):
+        request = self.context.get('request')
+        if request is None:
+            return None
+        return image_srcset(
+            obj.image, obj.image_variants, lambda name: absolute_uri(request, obj.image.storage.url(name))
+        )
 
-class ProductListSerializer(serializers.ModelSerializer):
+
+class ProductListSerializer(SparseFieldsMixin, CompiledReadersMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+    field_sources = {
+        'image_url': ['image'],
+        'image_srcset': ['image', 'image_variants'],
+        'is_in_stock': ['stock_quantity'],
+    }
     
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'slug', 'price', 'category', 'product_type',
-            'brand', 'model', 'image', 'image_url', 'stock_quantity',
+            'brand', 'model', 'image', 'image_url', 'image_srcset', 'stock_quantity',
             'is_in_stock', 'created_at'
         ]
+        list_serializer_class = CompiledListSerializer
 
     def get_image_url(self, obj):
         if obj.image:
             request = self.context.get('request')
             if request:
-                return request.build_absolute_uri(obj.image.url)
+                return absolute_uri(request, obj.image.url)
         return None
 
+    def get_image_srcset(self, obj):
+        request = self.context.get('request')
+        if request is None:
+            return None
+        return image_srcset(
+            obj.image, obj.image_variants, lambda name: absolute_uri(request, obj.image.storage.url(name))
+        )
+
+    def compile_image_url(self, field):
+        # Same absolute URL as the `image` field, resolved once for both
+        if self.context.get('request') is None:
+            return lambda obj: None
+        return lambda obj: self._file_url(obj.image) if obj.image else None
+
+    def compile_image_srcset(self, field):
+        request = self.context.get('request')
+        if request is None:
+            return lambda obj: None
+        storage = Product._meta.get_field('image').storage
+        return lambda obj: image_srcset(
+            obj.image, obj.image_variants, lambda name: absolute_uri(request, storage.url(name))
+        )
+
 
 class ProductCreateSerializer(serializers.ModelSerializer):
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
@@ -80,24 +282,15 @@ class ProductCreateSerializer(serializers.ModelSerializer):
         }
     
     def create(self, validated_data):
-        # Auto-generate slug from name
-        name = validated_data['name']
-        base_slug = slugify(name)
-        slug = base_slug
-        counter = 1
-        
-        # Ensure unique slug
-        while Product.objects.filter(slug=slug).exists():
-            slug = f"{base_slug}-{counter}"
-            counter += 1
-        
-        validated_data['slug'] = slug
-        
         # Set is_active to True by default
         validated_data['is_active'] = True
-        
+
+        # Auto-generate a unique slug from name
         # created_by will be set by perform_create in the view
-        return super().create(validated_data)
+        def save(slug):
+            return super(ProductCreateSerializer, self).create({**validated_data, 'slug': slug})
+
+        return save_with_unique_slug(validated_data['name'], save)
 
 
 class ProductUpdateSerializer(serializers.ModelSerializer):
@@ -114,18 +307,11 @@ class ProductUpdateSerializer(serializers.ModelSerializer):
         }
     
     def update(self, instance, validated_data):
-        # If name is being updated, regenerate slug
+        # If name is being updated, regenerate slug (unique excluding current instance)
         if 'name' in validated_data and validated_data['name'] != instance.name:
-            name = validated_data['name']
-            base_slug = slugify(name)
-            slug = base_slug
-            counter = 1
-            
-            # Ensure unique slug (excluding current instance)
-            while Product.objects.filter(slug=slug).exclude(pk=instance.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            
-            validated_data['slug'] = slug
-        
+            def save(slug):
+                return super(ProductUpdateSerializer, self).update(instance, {**validated_data, 'slug': slug})
+
+            return save_with_unique_slug(validated_data['name'], save, exclude_pk=instance.pk)
+
         return super().update(instance, validated_data)
@@ -0,0 +1,205 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.signals import setting_changed
+from django.db.models import Count, F
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import (
+    invalidate_cache_tags, product_tag, category_tag, user_tag, PRODUCTS_TAG, CATEGORIES_TAG,
+)
+from .images import needs_derivatives, schedule_derivatives, variant_names
+from .models import Category, CategoryProductCount, Product, ProductSpecification
+from .storage import ContentAddressedStorage
+
+
+def _adjust_active_count(category_id, delta):
+    if category_id is None:
+        return
+    counter = CategoryProductCount.objects.filter(category_id=category_id)
+    if delta < 0:
+        # A counter that drifted low (raw updates, bulk_create) must not go negative
+        counter = counter.filter(active_products__gte=-delta)
+    if not counter.update(active_products=F('active_products') + delta):
+        # Missing or drifted row: the product row is already written, count afresh
+        recount_category_products([category_id])
+
+
+def recount_category_products(category_ids=None):
+    """Rebuild CategoryProductCount rows (all of them, or for ``category_ids``)."""
+    categories = Category.objects.all()
+    products = Product.objects.filter(is_active=True)
+    if category_ids is not None:
+        categories = categories.filter(pk__in=category_ids)
+        products = products.filter(category_id__in=category_ids)
+    counts = dict(products.order_by().values_list('category').annotate(count=Count('pk')))
+    CategoryProductCount.objects.bulk_create(
+        [
+            CategoryProductCount(category_id=pk, active_products=counts.get(pk, 0))
+            for pk in categories.values_list('pk', flat=True)
+        ],
+        update_conflicts=True,
+        unique_fields=['category'],
+        update_fields=['active_products'],
+    )
+
+
+def remember_counted_state(sender, instance, raw=False, **kwargs):
+    # The row as it is in the database decides what the save has to undo
+    instance._counted_state = None
+    if instance.pk is not None and not raw:
+        instance._counted_state = (
+            Product.objects.filter(pk=instance.pk)
+            .values_list('category_id', 'is_active')
+            .first()
+        )
+
+
+def update_category_count_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_category_id, old_active = getattr(instance, '_counted_state', None) or (None, False)
+    old = old_category_id if old_active else None
+    new = instance.category_id if instance.is_active else None
+    if old != new:
+        _adjust_active_count(old, -1)
+        _adjust_active_count(new, 1)
+
+
+def update_category_count_on_delete(sender, instance, **kwargs):
+    if instance.is_active:
+        _adjust_active_count(instance.category_id, -1)
+
+
+COUNTER_RECEIVERS = [
+    (pre_save, remember_counted_state),
+    (post_save, update_category_count_on_save),
+    (post_delete, update_category_count_on_delete),
+]
+
+
+def connect_category_counters(enabled):
+    """
+    Maintain CategoryProductCount on Product saves only while
+    PRODUCT_CATEGORY_COUNTERS is on; otherwise saves pay nothing for it.
+    Run recount_category_products() after turning it on.
+    """
+    for signal, handler in COUNTER_RECEIVERS:
+        if enabled:
+            signal.connect(handler, sender=Product, dispatch_uid=handler.__name__)
+        else:
+            signal.disconnect(handler, sender=Product, dispatch_uid=handler.__name__)
+
+
+connect_category_counters(settings.PRODUCT_CATEGORY_COUNTERS)
+
+
+@receiver(setting_changed)
+def toggle_category_counters(setting, value, **kwargs):
+    if setting == 'PRODUCT_CATEGORY_COUNTERS':
+        connect_category_counters(value)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_responses(sender, instance, **kwargs):
+    # Any product change can move it in or out of a filtered/sorted list
+    invalidate_cache_tags(product_tag(instance.pk), PRODUCTS_TAG)
+
+
+@receiver(post_save, sender=Product)
+def render_product_image_derivatives(sender, instance, raw=False, **kwargs):
+    if not raw and needs_derivatives(instance):
+        schedule_derivatives(instance, [product_tag(instance.pk), PRODUCTS_TAG])
+
+
+@receiver(post_save, sender=Category)
+def render_category_image_derivatives(sender, instance, raw=False, **kwargs):
+    if not raw and needs_derivatives(instance):
+        schedule_derivatives(instance, [category_tag(instance.pk), CATEGORIES_TAG])
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def release_image_files(sender, instance, **kwargs):
+    # Only files stored under their upload name go here; shared
+    # content-addressed ones are left to the garbage sweep (products.storage)
+    storage = instance.image.storage
+    if not isinstance(storage, ContentAddressedStorage):
+        return
+    names = variant_names(instance.image_variants)
+    if instance.image:
+        names.add(instance.image.name)
+    if names:
+        transaction.on_commit(lambda: [storage.delete(name) for name in sorted(names)])
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_responses(sender, instance, **kwargs):
+    invalidate_cache_tags(category_tag(instance.pk), CATEGORIES_TAG)
+
+
+@receiver([post_save, post_delete], sender=ProductSpecification)
+def invalidate_specification_responses(sender, instance, **kwargs):
+    # Specifications appear in the product detail payload, and spec filters
+    # decide which products the list and facets responses contain
+    invalidate_cache_tags(product_tag(instance.product_id), PRODUCTS_TAG)
+
+
+# User fields rendered in product details (ProductSerializer.created_by)
+CREATOR_FIELDS = {'username'}
+
+
+@receiver(post_save, sender=User)
+def invalidate_creator_responses(sender, instance, update_fields=None, **kwargs):
+    # Logins save last_login only and must not expire the creator's products
+    if update_fields is None or CREATOR_FIELDS.intersection(update_fields):
+        invalidate_cache_tags(user_tag(instance.pk))
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_creator_responses(sender, instance, **kwargs):
+    invalidate_cache_tags(user_tag(instance.pk))
+
+
+def product_specs(product_id):
+    return [
+        {'name': name, 'value': value}
+        for name, value in ProductSpecification.objects.filter(product_id=product_id)
+        .order_by('id').values_list('name', 'value')
+    ]
+
+
+def refresh_product_specs(product_ids=None):
+    """
+    Rebuild Product.specs (for all products, or for ``product_ids``), e.g.
+    after specifications were written with bulk_create() or update().
+    """
+    rows = ProductSpecification.objects.order_by('product_id', 'id')
+    products = Product.objects.only('pk')
+    if product_ids is not None:
+        rows = rows.filter(product_id__in=product_ids)
+        products = products.filter(pk__in=product_ids)
+    specs = defaultdict(list)
+    for product_id, name, value in rows.values_list('product_id', 'name', 'value'):
+        specs[product_id].append({'name': name, 'value': value})
+    products = list(products)
+    for product in products:
+        product.specs = specs.get(product.pk, [])
+    Product.objects.bulk_update(products, ['specs'], batch_size=500)
+
+
+@receiver([post_save, post_delete], sender=ProductSpecification)
+def sync_product_specs(sender, instance, raw=False, **kwargs):
+    # Covers the API and the admin inline alike. Touching updated_at keeps it
+    # a valid Last-Modified/ETag source for the detail view
+    if raw:
+        return
+    specs = product_specs(instance.product_id)
+    Product.objects.filter(pk=instance.product_id).update(specs=specs, updated_at=timezone.now())
+    # A later save() of the caller's product instance must not write back stale specs
+    if ProductSpecification.product.is_cached(instance):
+        instance.product.specs = specs
@@ -0,0 +1,90 @@
+"""
+Unique slug allocation for products.
+
+Slugs follow the existing scheme: ``base``, then ``base-1``, ``base-2``...
+All taken variants of a base are read in one query and the first free one
+is picked in Python. The unique constraint on Product.slug stays the final
+arbiter: callers save inside save_with_unique_slug(), which retries with a
+fresh allocation if a concurrent request took the slug first.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+from .models import Product
+
+SLUG_RETRIES = 5
+# Keeps the OR-ed prefix filter of allocate_slugs() to a sane size
+BATCH_SIZE = 200
+
+
+def base_slug(name):
+    return slugify(name) or 'product'
+
+
+def _taken_filter(bases):
+    return reduce(or_, (Q(slug=base) | Q(slug__startswith=f'{base}-') for base in bases))
+
+
+def _taken_slugs(bases, exclude_pk=None):
+    queryset = Product.objects.filter(_taken_filter(bases)).order_by()
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    return set(queryset.values_list('slug', flat=True))
+
+
+def _first_free(base, taken):
+    if base not in taken:
+        return base
+    pattern = re.compile(rf'^{re.escape(base)}-(\d+)$')
+    used = {int(match.group(1)) for match in map(pattern.match, taken) if match}
+    counter = 1
+    while counter in used:
+        counter += 1
+    return f'{base}-{counter}'
+
+
+def allocate_slug(name, exclude_pk=None):
+    """Return the first free slug for ``name`` using a single query."""
+    base = base_slug(name)
+    return _first_free(base, _taken_slugs([base], exclude_pk))
+
+
+def allocate_slugs(names):
+    """
+    Allocate slugs for many new products at once, e.g. for bulk imports.
+
+    Returns one slug per name, in order, unique against the database and
+    within the batch, with one query per BATCH_SIZE distinct names.
+    """
+    bases = [base_slug(name) for name in names]
+    distinct = list(dict.fromkeys(bases))
+    taken = set()
+    for start in range(0, len(distinct), BATCH_SIZE):
+        taken |= _taken_slugs(distinct[start:start + BATCH_SIZE])
+
+    slugs = []
+    for base in bases:
+        slug = _first_free(base, taken)
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def save_with_unique_slug(name, save, exclude_pk=None):
+    """
+    Call ``save(slug)`` with a freshly allocated slug, retrying when a
+    concurrent writer claimed the same slug between allocation and insert.
+    """
+    for attempt in range(SLUG_RETRIES):
+        slug = allocate_slug(name, exclude_pk)
+        try:
+            with transaction.atomic():
+                return save(slug)
+        except IntegrityError:
+            if attempt == SLUG_RETRIES - 1 or not Product.objects.filter(slug=slug).exists():
+                raise
@@ -0,0 +1,124 @@
+"""
+Content-addressed media storage.
+
+Every saved file is named after the SHA-256 of its bytes
+(``cas/ab/ab12...ef.png`` under MEDIA_ROOT), whatever name it was uploaded
+under, so identical images - the same stock photo assigned to many products,
+the same derivative rendered twice - are stored once. A name never changes
+meaning, so its URL can be cached forever (see content_addressed_media).
+
+Since files are shared, and a name may already be referenced by a save that
+has not committed yet, delete() leaves content-addressed files in place.
+collect_garbage() removes them in a periodic sweep (collect_media_garbage.py)
+once no row names them any more - neither a FileField using this storage nor
+the matching ``<field>_variants`` JSON column (products.images) - and they
+have not been saved again for a grace period.
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+
+CONTENT_DIR = 'cas'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # The stored name comes from the content (see _save), it never collides
+        return name
+
+    def content_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        return f'{CONTENT_DIR}/{digest[:2]}/{digest}{extension}'
+
+    def _save(self, name, content):
+        directory = self.path(CONTENT_DIR)
+        os.makedirs(directory, exist_ok=True)
+
+        # Hash while writing to a temporary file, then move it under its hash
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            name = self.content_name(digest.hexdigest(), name)
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                # Fresh mtime: the sweep spares it while the new reference commits
+                os.utime(full_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.chmod(temp_path, self.file_permissions_mode or 0o644)
+                # Atomic: a concurrent save of the same bytes just replaces it
+                os.replace(temp_path, full_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return name
+
+    def reference_fields(self):
+        """``(model, file field, variants field or None)`` for every field stored here."""
+        for model in apps.get_models():
+            for field in model._meta.get_fields():
+                if isinstance(field, models.FileField) and isinstance(field.storage, ContentAddressedStorage):
+                    try:
+                        variants = model._meta.get_field(f'{field.name}_variants')
+                    except FieldDoesNotExist:
+                        variants = None
+                    yield model, field, variants
+
+    def referenced_names(self):
+        """Every name a file field or derivatives record of a stored row points to."""
+        names = set()
+        for model, field, variants in self.reference_fields():
+            columns = [field.name] + ([variants.name] if variants is not None else [])
+            for row in model._default_manager.values_list(*columns).iterator():
+                if row[0]:
+                    names.add(row[0])
+                if len(row) > 1:
+                    for sizes in (row[1] or {}).get('formats', {}).values():
+                        names.update(sizes.values())
+        return names
+
+    def delete(self, name):
+        # Content-addressed files may be shared; collect_garbage() removes them
+        if not name.startswith(f'{CONTENT_DIR}/'):
+            super().delete(name)
+
+    def collect_garbage(self, grace=24 * 60 * 60, dry_run=False):
+        """
+        Delete content-addressed files no row references that were last
+        saved more than ``grace`` seconds ago, plus abandoned temporary
+        uploads. Returns the deleted names.
+        """
+        # References first: a file saved after this point has a fresh mtime
+        referenced = self.referenced_names()
+        cutoff = time.time() - grace
+        deleted = []
+        root = self.path(CONTENT_DIR)
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.location).replace(os.sep, '/')
+                if name in referenced:
+                    continue
+                try:
+                    if os.path.getmtime(path) > cutoff:
+                        continue
+                    if not dry_run:
+                        os.remove(path)
+                except FileNotFoundError:
+                    continue
+                deleted.append(name)
+        return sorted(deleted)
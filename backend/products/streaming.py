@@ -0,0 +1,64 @@
+"""
+Streaming JSON for large product pages (``?stream=1``).
+
+The page is read with QuerySet.iterator() and serialized and encoded a
+chunk at a time into a StreamingHttpResponse, so memory stays flat
+whatever the page size and the first bytes are sent before the last row
+is read. The document has the same keys as the buffered response; keys
+that depend on the last row (the cursor links) come after ``results``.
+Streamed responses are not stored in the response cache.
+"""
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+
+STREAM_QUERY_PARAM = 'stream'
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+class StreamingListMixin:
+    """For list views paginated by ProductPagination."""
+    stream_chunk_size = 200
+
+    def should_stream(self, request):
+        # The browsable API renders a whole page of HTML, nothing to stream
+        return (
+            request.query_params.get(STREAM_QUERY_PARAM, '').lower() in TRUE_VALUES
+            and request.accepted_renderer.format == 'json'
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.should_stream(request):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        head, rows, tail = self.paginator.stream_page(
+            queryset, request, self, self.stream_chunk_size
+        )
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        return StreamingHttpResponse(self.stream_json(head, rows, tail), content_type=content_type)
+
+    def stream_json(self, head, rows, tail):
+        renderer = self.request.accepted_renderer
+        context = self.get_renderer_context()
+
+        def render(data):
+            content = renderer.render(data, self.request.accepted_media_type, context)
+            return content.encode(renderer.charset or 'utf-8') if isinstance(content, str) else content
+
+        # Objects and arrays are rendered whole and their brackets trimmed
+        opening = render(head)[:-1].rstrip()
+        yield opening + (b',"results":[' if head else b'"results":[')
+
+        serializer = self.get_serializer(many=True)
+        separator = b''
+        for chunk in iter(lambda: list(islice(rows, self.stream_chunk_size)), []):
+            items = render(serializer.to_representation(chunk))[1:-1].strip()
+            yield separator + items
+            separator = b','
+
+        closing = render(tail())[1:-1].strip()
+        yield b'],' + closing + b'}' if closing else b']}'
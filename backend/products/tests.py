@@ -1,3 +1,1257 @@
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.text import slugify
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.serializers import ListSerializer
+from rest_framework.test import APIClient
+from rest_framework.utils.urls import remove_query_param
+
+from .cache import get_tagged, product_snapshot_key
+from .models import Category, CategoryProductCount, Product, ProductSpecification
+from .search import install_search_index, uninstall_search_index
+from .serializers import CategorySerializer, ProductListSerializer
+from . import slugs
+from .views import ProductListView, content_addressed_media
+
+# Plan lines reading products_product, and those reading it without any index
+PRODUCT_ACCESS = re.compile(r'^(SCAN|SEARCH) products_product\b')
+# Spec filter subqueries read products_productspecification aliased as U0
+SUBQUERY_ACCESS = re.compile(r'^(SCAN|SEARCH) U\d+\b')
+SPEC_POSTINGS = re.compile(r'^SEARCH U\d+ USING COVERING INDEX spec_name_value_product_idx\b')
+FULL_SCAN = re.compile(r'^SCAN products_product\b(?! USING)')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite syntax')
+class CatalogQueryPlanTests(TestCase):
+    """
+    Every catalog query on products_product must be served by an index.
+
+    The queries are captured from the real endpoints, so a change to a view,
+    a filter or the indexes that makes one of them scan the table fails here.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.computers = Category.objects.create(name='Computers', slug='computers')
+        cls.parts = Category.objects.create(name='Parts', slug='parts')
+        products = []
+        for i in range(40):
+            computer = i % 10 == 0
+            products.append(Product(
+                name=f'Product {i}', slug=f'product-{i}', description='Test product',
+                price=f'{100 + i}.00', category=cls.computers if computer else cls.parts,
+                product_type='computer' if computer else 'component',
+                brand=f'Brand {i % 4}', model=f'M{i}', is_active=i % 7 != 0,
+            ))
+        Product.objects.bulk_create(products)
+        ProductSpecification.objects.bulk_create([
+            ProductSpecification(product=product, name=name, value=f'{value} {i % 3}')
+            for i, product in enumerate(products)
+            for name, value in [('Процессор', 'Intel Core i7'), ('Память', '32GB DDR5')]
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def product_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'products_product' in query['sql']
+        ]
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexed(self, url, search=False, sorted_page=True):
+        """
+        No query of ``url`` reads products_product without an index. With
+        ``search`` every access must be an index range SEARCH rather than a
+        walk over a whole index; with ``sorted_page`` LIMIT-ed queries must
+        read rows in index order instead of sorting them in a temp b-tree.
+        """
+        queries = self.product_queries(url)
+        self.assertTrue(queries, url)
+        for sql in queries:
+            plan = self.explain(sql)
+            report = f'{url}:\n{sql}\n' + '\n'.join(plan)
+            product_lines = [line for line in plan if PRODUCT_ACCESS.search(line)]
+            self.assertFalse([line for line in product_lines if FULL_SCAN.search(line)], report)
+            if search:
+                self.assertTrue(all(line.startswith('SEARCH') for line in product_lines), report)
+            if sorted_page and ' LIMIT ' in sql:
+                self.assertFalse([line for line in plan if 'TEMP B-TREE FOR ORDER BY' in line], report)
+
+    def test_product_list(self):
+        for url in [
+            '/api/products/products/',
+            '/api/products/products/?ordering=price',
+            '/api/products/products/?ordering=-price',
+            '/api/products/products/?ordering=name',
+            '/api/products/products/?ordering=-created_at&page=2',
+        ]:
+            with self.subTest(url=url):
+                self.assertIndexed(url)
+
+    def test_product_list_filters(self):
+        for url in [
+            f'/api/products/products/?category={self.parts.id}',
+            '/api/products/products/?product_type=component',
+            '/api/products/products/?brand=Brand 1',
+        ]:
+            with self.subTest(url=url):
+                self.assertIndexed(url, search=True)
+
+    def test_product_list_cursor(self):
+        first = self.client.get('/api/products/products/?cursor=&page_size=5').json()
+        for url in ['/api/products/products/?cursor=&page_size=5', first['next']]:
+            with self.subTest(url=url):
+                self.assertIndexed(url.replace('http://testserver', ''))
+
+    def test_featured_products(self):
+        # Four active computers: the view also runs its fallback query. The
+        # featured query merges two product types, so it sorts its few rows
+        self.assertEqual(len(self.product_queries('/api/products/products/featured/')), 2)
+        self.assertIndexed('/api/products/products/featured/', sorted_page=False)
+
+    def test_product_categories(self):
+        self.assertIndexed('/api/products/products/categories/', search=True)
+
+    def test_spec_filters(self):
+        url = '/api/products/products/?spec=Память:32GB DDR5 1&spec=Процессор~i7'
+        self.assertIndexed(url, search=True, sorted_page=False)
+        for sql in self.product_queries(url):
+            if 'products_productspecification' not in sql:
+                continue
+            plan = self.explain(sql)
+            # One index-only posting list lookup per condition
+            lookups = [line for line in plan if SUBQUERY_ACCESS.search(line)]
+            self.assertEqual(len(lookups), 2, plan)
+            self.assertTrue(all(SPEC_POSTINGS.search(line) for line in lookups), plan)
+
+    def test_product_compare(self):
+        self.assertIndexed('/api/products/products/compare/?slugs=product-1,product-2,nope', search=True)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'The FTS5 index is SQLite only')
+class ProductSearchTests(TestCase):
+    """?search= on the full-text index: prefixes, AND across words, relevance order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Computers', slug='computers')
+        for name, brand, price, description in [
+            ('Gaming PC', 'ASUS', '2000.00', 'RTX 4090 graphics'),
+            ('Office PC', 'Dell', '800.00', 'Quiet machine, fine for casual gaming'),
+            ('Graphics card', 'Gigabyte', '1500.00', 'Video card'),
+        ]:
+            Product.objects.create(
+                name=name, slug=slugify(name), description=description, price=price,
+                category=category, product_type='computer', brand=brand, model='M',
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def search(self, query, **params):
+        # Queryset updates below bypass the cache invalidation signals
+        cache.clear()
+        response = self.client.get('/api/products/products/', {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.json()['results']]
+
+    def test_prefix_and_all_words(self):
+        self.assertCountEqual(self.search('gam'), ['Gaming PC', 'Office PC'])
+        self.assertEqual(self.search('gaming asus'), ['Gaming PC'])
+        self.assertEqual(self.search('gam del'), ['Office PC'])
+        self.assertEqual(self.search('gaming nvidia'), [])
+
+    def test_relevance_order(self):
+        # A name hit outranks a description hit
+        self.assertEqual(self.search('gaming'), ['Gaming PC', 'Office PC'])
+        self.assertEqual(self.search('graphics'), ['Graphics card', 'Gaming PC'])
+        self.assertEqual(self.search('gaming', ordering='price'), ['Office PC', 'Gaming PC'])
+
+    def test_index_follows_writes(self):
+        product = Product.objects.get(name='Office PC')
+        product.name = 'Workstation'
+        product.save()
+        self.assertEqual(self.search('workstation'), ['Workstation'])
+        self.assertEqual(self.search('office'), [])
+
+        Product.objects.filter(pk=product.pk).update(description='Blender rendering box')
+        self.assertEqual(self.search('blender'), ['Workstation'])
+        self.assertEqual(self.search('gaming'), ['Gaming PC'])
+
+        product.delete()
+        self.assertEqual(self.search('workstation'), [])
+
+    def test_fallback_without_index(self):
+        uninstall_search_index(connection)
+        self.addCleanup(install_search_index, connection)
+        # icontains on the search fields: substrings match, every word must
+        self.assertCountEqual(self.search('aming'), ['Gaming PC', 'Office PC'])
+        self.assertEqual(self.search('gaming asus'), ['Gaming PC'])
+
+
+@override_settings(PRODUCT_CATEGORY_COUNTERS=True)
+class CategoryCounterTests(TestCase):
+    """CategoryProductCount follows every Product change that moves an active product."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        cls.computers = Category.objects.create(name='Computers', slug='computers')
+        cls.parts = Category.objects.create(name='Parts', slug='parts')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def create_product(self, slug, category=None, **kwargs):
+        return Product.objects.create(
+            name=slug, slug=slug, description='Test product', price='100.00',
+            category=category or self.computers, product_type='computer',
+            brand='Brand', model='M', created_by=self.user, **kwargs
+        )
+
+    def counts(self):
+        return dict(CategoryProductCount.objects.values_list('category__slug', 'active_products'))
+
+    def test_create(self):
+        self.create_product('a')
+        self.create_product('b')
+        self.create_product('c', is_active=False)
+        self.assertEqual(self.counts(), {'computers': 2})
+
+    def test_deactivate_and_reactivate(self):
+        product = self.create_product('a')
+        product.is_active = False
+        product.save()
+        self.assertEqual(self.counts(), {'computers': 0})
+        product.is_active = True
+        product.save()
+        self.assertEqual(self.counts(), {'computers': 1})
+
+    def test_move_category(self):
+        product = self.create_product('a')
+        product.category = self.parts
+        product.save()
+        self.assertEqual(self.counts(), {'computers': 0, 'parts': 1})
+
+    def test_delete(self):
+        self.create_product('a')
+        product = self.create_product('b')
+        product.delete()
+        self.assertEqual(self.counts(), {'computers': 1})
+
+    def test_delete_with_drifted_counter(self):
+        # Rows written behind the signals leave the counter below the truth
+        self.create_product('a')
+        Product.objects.bulk_create([
+            Product(name=slug, slug=slug, description='Test product', price='1.00',
+                    category=self.computers, product_type='computer', brand='B', model='M',
+                    created_by=self.user)
+            for slug in ['b', 'c']
+        ])
+        CategoryProductCount.objects.update(active_products=0)
+        self.client.force_authenticate(self.user)
+        response = self.client.delete('/api/products/products/b/delete/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.counts(), {'computers': 2})
+
+    def test_product_categories(self):
+        self.create_product('a')
+        self.create_product('b', category=self.parts)
+        self.create_product('c', category=self.parts)
+        data = self.client.get('/api/products/products/categories/').json()
+        self.assertEqual({row['slug']: row['product_count'] for row in data}, {'computers': 1, 'parts': 2})
+
+    def test_disabled(self):
+        with override_settings(PRODUCT_CATEGORY_COUNTERS=False):
+            product = self.create_product('a')
+            product.is_active = False
+            with CaptureQueriesContext(connection) as queries:
+                product.save()
+        self.assertFalse(CategoryProductCount.objects.exists())
+        # No lookup of the previous state and no counter update
+        self.assertFalse([q['sql'] for q in queries.captured_queries if 'categoryproductcount' in q['sql']])
+        self.assertFalse([q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')])
+
+
+class ProductCursorPaginationTests(TestCase):
+    """Cursor pages cover every row exactly once, forwards and backwards, ties included."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Computers', slug='computers')
+        Product.objects.bulk_create([
+            Product(
+                name=f'Product {i % 4}', slug=f'product-{i}', description='Test product',
+                price=f'{100 + i % 3}.00', category=category, product_type='computer',
+                brand='Brand', model=f'M{i}',
+            )
+            for i in range(23)
+        ])
+        # Ties on created_at as well: bulk inserts share timestamps
+        first = Product.objects.order_by('id')[0].created_at
+        Product.objects.filter(id__in=Product.objects.order_by('id').values('id')[:10]).update(created_at=first)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, url):
+        response = self.client.get(url.replace('http://testserver', ''))
+        self.assertEqual(response.status_code, 200, url)
+        return response.json()
+
+    def test_walk(self):
+        for ordering in ['-created_at', 'price', '-price', 'name', '-name']:
+            with self.subTest(ordering=ordering):
+                tiebreak = '-id' if ordering.startswith('-') else 'id'
+                expected = list(Product.objects.order_by(ordering, tiebreak).values_list('slug', flat=True))
+
+                pages = [self.get(f'/api/products/products/?ordering={ordering}&cursor=&page_size=5')]
+                self.assertIsNone(pages[0]['previous'])
+                while pages[-1]['next']:
+                    pages.append(self.get(pages[-1]['next']))
+                walked = [product['slug'] for page in pages for product in page['results']]
+                self.assertEqual(walked, expected)
+                self.assertEqual(len(pages), 5)
+
+                # Previous links return the same pages in reverse
+                page = pages[-1]
+                for earlier in reversed(pages[:-1]):
+                    page = self.get(page['previous'])
+                    self.assertEqual(page['results'], earlier['results'])
+                self.assertIsNone(page['previous'])
+
+    def test_invalid_cursor(self):
+        first = self.get('/api/products/products/?cursor=&page_size=5')
+        # A cursor of one ordering is rejected by another
+        url = first['next'].replace('http://testserver', '') + '&ordering=price'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get('/api/products/products/?cursor=garbage').status_code, 404)
+
+
+class StreamingListTests(TestCase):
+    """``?stream=1`` sends the same document as the buffered response."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Computers', slug='computers')
+        Product.objects.bulk_create([
+            Product(
+                name=f'Product {i}', slug=f'product-{i}', description='Test product',
+                price=f'{100 + i % 3}.00', category=category, product_type='computer',
+                brand='Brand' if i % 2 else 'Other', model=f'M{i}',
+            )
+            for i in range(7)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, url):
+        response = self.client.get(url.replace('http://testserver', ''))
+        self.assertEqual(response.status_code, 200, url)
+        return response
+
+    def streamed(self, url):
+        response = self.get(url + '&stream=1')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = json.loads(b''.join(response.streaming_content))
+        # Links carry ?stream=1 on to the next page
+        for key in ('next', 'previous'):
+            if data.get(key):
+                self.assertIn('stream=1', data[key])
+                data[key] = remove_query_param(data[key], 'stream')
+        return data
+
+    def assertStreamMatches(self, url):
+        buffered = self.get(url)
+        self.assertFalse(buffered.streaming)
+        streamed = self.streamed(url)
+        self.assertEqual(streamed, buffered.json())
+        return streamed
+
+    def test_page_mode(self):
+        for url in [
+            '/api/products/products/?page_size=3',
+            '/api/products/products/?page_size=3&page=2',
+            '/api/products/products/?page_size=3&page=3&ordering=price',
+            '/api/products/products/?page_size=100',
+        ]:
+            with self.subTest(url=url):
+                self.assertStreamMatches(url)
+
+    def test_cursor_mode(self):
+        url = '/api/products/products/?ordering=price&cursor=&page_size=3'
+        pages = [self.assertStreamMatches(url)]
+        while pages[-1]['next']:
+            pages.append(self.assertStreamMatches(pages[-1]['next']))
+        self.assertEqual(len(pages), 3)
+        # Previous pages are read backwards
+        page = pages[-1]
+        while page['previous']:
+            page = self.assertStreamMatches(page['previous'])
+        self.assertEqual(page['results'], pages[0]['results'])
+
+    def test_small_chunks(self):
+        with mock.patch.object(ProductListView, 'stream_chunk_size', 2):
+            self.assertStreamMatches('/api/products/products/?page_size=5')
+            self.assertStreamMatches('/api/products/products/?cursor=&page_size=5')
+
+    def test_empty_page(self):
+        for url in [
+            '/api/products/products/?brand=Missing',
+            '/api/products/products/?brand=Missing&cursor=',
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.assertStreamMatches(url)['results'], [])
+
+    def test_streamed_not_cached(self):
+        url = '/api/products/products/?ordering=name&page_size=1'
+        first = self.streamed(url)
+        # A queryset update sends no signals, so only an uncached response sees it
+        Product.objects.filter(slug=first['results'][0]['slug']).update(name='Product 0 renamed')
+        self.assertEqual(self.streamed(url)['results'][0]['name'], 'Product 0 renamed')
+
+        self.get(url)
+        Product.objects.filter(slug=first['results'][0]['slug']).update(name='Product 0 again')
+        self.assertEqual(self.get(url).json()['results'][0]['name'], 'Product 0 renamed')
+
+    def test_browsable_api_not_streamed(self):
+        response = self.client.get('/api/products/products/?stream=1', HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.streaming)
+
+@override_settings(PRODUCT_PRICE_BUCKETS=[1000, 5000])
+class ProductFacetsTests(TestCase):
+    url = '/api/products/products/facets/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.computers = Category.objects.create(name='Computers', slug='computers')
+        cls.monitors = Category.objects.create(name='Monitors', slug='monitors')
+        for slug, category, product_type, brand, price, is_active in [
+            ('a', cls.computers, 'computer', 'ASUS', '500.00', True),
+            ('b', cls.computers, 'computer', 'MSI', '1500.00', True),
+            ('c', cls.computers, 'computer', 'ASUS', '6000.00', True),
+            ('d', cls.monitors, 'peripheral', 'Dell', '1000.00', True),
+            ('e', cls.monitors, 'peripheral', 'ASUS', '4999.99', True),
+            ('f', cls.computers, 'computer', 'MSI', '100.00', False),
+        ]:
+            Product.objects.create(
+                name=slug, slug=slug, description='Test product', price=price, category=category,
+                product_type=product_type, brand=brand, model='M', is_active=is_active,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, query=''):
+        response = self.client.get(f'{self.url}?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def counts(self, facets, name, key='value'):
+        return {row[key]: row['count'] for row in facets[name]}
+
+    def test_unfiltered(self):
+        with self.assertNumQueries(5):
+            facets = self.get()
+        self.assertEqual(facets['total'], 5)
+        self.assertEqual(facets['category'], [
+            {'id': self.computers.id, 'name': 'Computers', 'slug': 'computers', 'count': 3},
+            {'id': self.monitors.id, 'name': 'Monitors', 'slug': 'monitors', 'count': 2},
+        ])
+        self.assertEqual(facets['product_type'][0]['value'], 'computer')
+        self.assertEqual(self.counts(facets, 'product_type'), {'computer': 3, 'peripheral': 2})
+        self.assertEqual(facets['brand'], [
+            {'value': 'ASUS', 'count': 3}, {'value': 'Dell', 'count': 1}, {'value': 'MSI', 'count': 1},
+        ])
+
+    def test_price_buckets(self):
+        # Lower edges are inclusive, the last bucket is open-ended
+        self.assertEqual(self.get()['price'], [
+            {'min': 0, 'max': 1000, 'count': 1},
+            {'min': 1000, 'max': 5000, 'count': 3},
+            {'min': 5000, 'max': None, 'count': 1},
+        ])
+
+    def test_facet_ignores_own_filter(self):
+        facets = self.get('brand=ASUS')
+        self.assertEqual(facets['total'], 3)
+        self.assertEqual(self.counts(facets, 'brand'), {'ASUS': 3, 'Dell': 1, 'MSI': 1})
+        self.assertEqual(self.counts(facets, 'category', 'slug'), {'computers': 2, 'monitors': 1})
+        self.assertEqual(self.counts(facets, 'product_type'), {'computer': 2, 'peripheral': 1})
+        self.assertEqual([row['count'] for row in facets['price']], [1, 1, 1])
+
+        facets = self.get('price__gte=1000')
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual([row['count'] for row in facets['price']], [1, 3, 1])
+        self.assertEqual(self.counts(facets, 'brand'), {'ASUS': 2, 'Dell': 1, 'MSI': 1})
+
+    def test_in_filters(self):
+        facets = self.get(f'brand__in=ASUS,MSI&category={self.computers.id}')
+        self.assertEqual(facets['total'], 3)
+        self.assertEqual(self.counts(facets, 'brand'), {'ASUS': 2, 'MSI': 1})
+        self.assertEqual(self.counts(facets, 'category', 'slug'), {'computers': 3, 'monitors': 1})
+
+        facets = self.get(f'category__in={self.computers.id},{self.monitors.id}&product_type__in=peripheral')
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(self.counts(facets, 'category', 'slug'), {'monitors': 2})
+        self.assertEqual(self.counts(facets, 'product_type'), {'computer': 3, 'peripheral': 2})
+
+    def test_invalid_filters(self):
+        for query in ['price__gte=abc', 'category=999', 'product_type=bogus', 'category__in=1,x', 'spec=Память']:
+            with self.subTest(query=query):
+                response = self.client.get(f'{self.url}?{query}')
+                self.assertEqual(response.status_code, 400)
+
+    def test_cached_per_filter_combination(self):
+        first = self.get('brand=ASUS&price__gte=1000')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get('price__gte=1000&brand=ASUS'), first)
+
+        # A queryset update sends no signals: cached combinations stay stale
+        Product.objects.filter(slug='c').update(brand='MSI')
+        self.assertEqual(self.get('brand=ASUS&price__gte=1000'), first)
+        with self.assertNumQueries(5):
+            self.assertEqual(self.get('brand=ASUS')['total'], 2)
+
+class SpecFilterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Computers', slug='computers')
+        for slug, specs in [
+            ('gaming', {'Процессор': 'Intel Core i7-14700K', 'Память': '32GB DDR5'}),
+            ('office', {'Процессор': 'Intel Core i5-12400', 'Память': '16GB DDR4'}),
+            ('studio', {'Процессор': 'AMD Ryzen 9', 'Память': '32GB DDR5'}),
+            ('budget', {'Процессор': 'Intel Core i7-8700', 'Память': '32GB DDR4'}),
+        ]:
+            product = Product.objects.create(
+                name=slug, slug=slug, description='Test product', price='100.00', category=category,
+                product_type='computer', brand='Brand', model='M',
+            )
+            for name, value in specs.items():
+                ProductSpecification.objects.create(product=product, name=name, value=value)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def slugs(self, *conditions):
+        query = '&'.join(f'spec={condition}' for condition in conditions)
+        response = self.client.get(f'/api/products/products/?ordering=name&{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [product['slug'] for product in response.json()['results']]
+
+    def test_exact_match(self):
+        self.assertEqual(self.slugs('Память:32GB DDR5'), ['gaming', 'studio'])
+        # Not a substring match, and only the named specification
+        self.assertEqual(self.slugs('Память:32GB'), [])
+        self.assertEqual(self.slugs('Процессор:32GB DDR5'), [])
+
+    def test_contains_match(self):
+        self.assertEqual(self.slugs('Процессор~i7'), ['budget', 'gaming'])
+        self.assertEqual(self.slugs('Процессор~intel'), ['budget', 'gaming', 'office'])
+        self.assertEqual(self.slugs('Память~i7'), [])
+
+    def test_conditions_anded(self):
+        self.assertEqual(self.slugs('Процессор~i7', 'Память:32GB DDR5'), ['gaming'])
+        self.assertEqual(self.slugs('Процессор~Intel', 'Память~DDR4'), ['budget', 'office'])
+        self.assertEqual(self.slugs('Процессор~AMD', 'Память:16GB DDR4'), [])
+
+    def test_whitespace_stripped(self):
+        self.assertEqual(self.slugs(' Память : 32GB DDR5 '), ['gaming', 'studio'])
+
+    def test_malformed_condition(self):
+        for condition in ['Память', 'Память:', ':32GB', '~i7', ' :x']:
+            with self.subTest(condition=condition):
+                response = self.client.get(f'/api/products/products/?spec=Процессор~i7&spec={condition}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('spec', response.json())
+
+class PlainProductListSerializer(ProductListSerializer):
+    """ProductListSerializer through DRF's own per-field serialization."""
+
+    class Meta(ProductListSerializer.Meta):
+        list_serializer_class = ListSerializer
+
+
+class CompiledListSerializerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.computers = Category.objects.create(
+            name='Computers', slug='computers', description='PCs', image='categories/pc.png',
+        )
+        cls.monitors = Category.objects.create(name='Monitors', slug='monitors')
+        for i in range(6):
+            Product.objects.create(
+                name=f'Product {i}', slug=f'product-{i}', description='Test product', price=f'{100 + i}.50',
+                category=cls.computers if i % 3 else cls.monitors, product_type='computer',
+                brand='Brand', model='M', stock_quantity=i % 2,
+                # Products 0 and 1 share an image file, product 2 has none
+                image=f'products/Фото {min(i, 1)}.png' if i != 2 else None,
+            )
+        Product.objects.filter(slug='product-1').update(image_variants={
+            'source': 'products/Фото 1.png',
+            'formats': {'image/webp': {'640': 'cas/ab/640.webp', '320': 'cas/ab/320.webp'}, 'image/avif': {}},
+        })
+        # Variants of a replaced image are ignored
+        Product.objects.filter(slug='product-3').update(image_variants={
+            'source': 'products/old.png', 'formats': {'image/webp': {'320': 'cas/cd/320.webp'}},
+        })
+
+    def products(self):
+        return Product.objects.select_related('category').order_by('id')
+
+    def context(self, secure=False):
+        return {'request': Request(RequestFactory().get('/api/products/products/', secure=secure))}
+
+    def assertSameAsPlain(self, queryset, context, **kwargs):
+        compiled = ProductListSerializer(queryset, many=True, context=context, **kwargs).data
+        plain = PlainProductListSerializer(queryset, many=True, context=context, **kwargs).data
+        self.assertEqual(compiled, plain)
+        # Byte for byte, so field order and value types match too
+        self.assertEqual(JSONRenderer().render(compiled), JSONRenderer().render(plain))
+        return compiled
+
+    def test_same_output_as_model_serializer(self):
+        for kwargs in [{}, {'fields': ['id', 'image_url', 'category']}, {'omit': ['image']}]:
+            with self.subTest(**kwargs):
+                self.assertSameAsPlain(self.products(), self.context(), **kwargs)
+        self.assertSameAsPlain(self.computers.products.order_by('id'), self.context())
+        self.assertEqual(self.assertSameAsPlain(Product.objects.none(), self.context()), [])
+
+    def test_images(self):
+        data = self.assertSameAsPlain(self.products(), self.context())
+        self.assertEqual(data[0]['image'], 'http://testserver/media/products/%D0%A4%D0%BE%D1%82%D0%BE%200.png')
+        self.assertEqual(data[0]['image_url'], data[0]['image'])
+        self.assertEqual(data[1]['image_srcset'], {
+            'image/webp': 'http://testserver/media/cas/ab/320.webp 320w, http://testserver/media/cas/ab/640.webp 640w',
+        })
+        self.assertIsNone(data[0]['image_srcset'])
+        self.assertIsNone(data[3]['image_srcset'])
+        self.assertEqual([data[2]['image'], data[2]['image_url']], [None, None])
+        self.assertEqual(data[1]['category']['image'], 'http://testserver/media/categories/pc.png')
+        self.assertIsNone(data[0]['category']['image'])
+
+        # The URL prefix follows each request
+        data = self.assertSameAsPlain(self.products(), self.context(secure=True))
+        self.assertTrue(data[0]['image'].startswith('https://testserver/media/'))
+
+    def test_without_request(self):
+        data = self.assertSameAsPlain(self.products(), {})
+        self.assertEqual(data[0]['image'], '/media/products/%D0%A4%D0%BE%D1%82%D0%BE%200.png')
+        self.assertEqual({row['image_url'] for row in data}, {None})
+        self.assertEqual({row['image_srcset'] for row in data}, {None})
+
+    def test_shared_category_serialized_once(self):
+        serializer = ProductListSerializer(self.products(), many=True, context=self.context())
+        with mock.patch.object(
+            CategorySerializer, 'to_representation', autospec=True, side_effect=CategorySerializer.to_representation,
+        ) as to_representation:
+            data = serializer.data
+        self.assertEqual(to_representation.call_count, 2)
+        self.assertEqual({row['category']['slug'] for row in data}, {'computers', 'monitors'})
+
+        # The memo lives for one call: later calls see changed categories
+        Category.objects.filter(pk=self.monitors.pk).update(name='Displays')
+        data = serializer.to_representation(self.products())
+        self.assertEqual(data[0]['category']['name'], 'Displays')
+
+class ProductSlugTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        cls.category = Category.objects.create(name='Computers', slug='computers')
+        for slug in ['gaming-pc', 'gaming-pc-1', 'gaming-pc-3']:
+            cls.create_product(slug)
+
+    @classmethod
+    def create_product(cls, slug, **kwargs):
+        return Product.objects.create(
+            name='Gaming PC', slug=slug, description='Test product', price='100.00',
+            category=cls.category, product_type='computer', brand='Brand', model='M', **kwargs
+        )
+
+    def test_create_takes_first_free_slug(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/products/products/create/', {
+            'name': 'Gaming PC', 'description': 'Test product', 'price': '100.00',
+            'category': self.category.id, 'product_type': 'computer', 'brand': 'Brand', 'model': 'M',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.json())
+        self.assertTrue(Product.objects.filter(slug='gaming-pc-2', created_by=self.user).exists())
+
+    def test_retry_after_concurrent_insert(self):
+        # The first allocation is stale: another writer took gaming-pc-2 since
+        allocate = slugs.allocate_slug
+        self.create_product('gaming-pc-2')
+        calls = []
+
+        def stale_then_fresh(name, exclude_pk=None):
+            calls.append(name)
+            return 'gaming-pc-2' if len(calls) == 1 else allocate(name, exclude_pk)
+
+        with mock.patch.object(slugs, 'allocate_slug', side_effect=stale_then_fresh):
+            product = slugs.save_with_unique_slug('Gaming PC', lambda slug: self.create_product(slug))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(product.slug, 'gaming-pc-4')
+
+    def test_other_integrity_errors_raised(self):
+        def save(slug):
+            raise IntegrityError('NOT NULL constraint failed')
+
+        with self.assertRaises(IntegrityError):
+            slugs.save_with_unique_slug('Gaming PC', save)
+
+    def test_allocate_slugs(self):
+        # All bases in one query, batch members never collide with each other
+        with self.assertNumQueries(1):
+            allocated = slugs.allocate_slugs(['Gaming PC', 'Gaming PC', 'Office PC', 'Gaming PC'])
+        self.assertEqual(allocated, ['gaming-pc-2', 'gaming-pc-4', 'office-pc', 'gaming-pc-5'])
+
+
+class CatalogCacheInvalidationTests(TestCase):
+    """Cached list, detail and featured responses expire when anything they show changes."""
+
+    list_url = '/api/products/products/'
+    detail_url = '/api/products/products/pc/'
+    featured_url = '/api/products/products/featured/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        cls.category = Category.objects.create(name='Computers', slug='computers')
+        cls.product = Product.objects.create(
+            name='PC', slug='pc', description='Test product', price='100.00', category=cls.category,
+            product_type='computer', brand='Brand', model='M', created_by=cls.user,
+        )
+        ProductSpecification.objects.create(product=cls.product, name='Память', value='16GB')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response.json()
+
+    def warm(self):
+        return {
+            'list': self.get(self.list_url)['results'][0],
+            'detail': self.get(self.detail_url),
+            'featured': self.get(self.featured_url)[0],
+        }
+
+    def snapshot(self):
+        return get_tagged(product_snapshot_key(RequestFactory().get('/'), 'pc'))
+
+    def test_responses_cached(self):
+        self.warm()
+        self.assertIsNotNone(self.snapshot())
+        for url in [self.list_url, self.detail_url, self.featured_url]:
+            with self.subTest(url=url), self.assertNumQueries(0):
+                self.get(url)
+
+    def test_scheme_cached_apart(self):
+        # Absolute media URLs in the body follow the request scheme
+        Product.objects.filter(pk=self.product.pk).update(image='products/pc.png')
+        for url in [self.list_url, self.detail_url, self.featured_url]:
+            with self.subTest(url=url):
+                plain = self.client.get(url).json()
+                secure = self.client.get(url, secure=True).json()
+                for data, scheme in [(plain, 'http'), (secure, 'https')]:
+                    if 'results' in data:
+                        data = data['results']
+                    if isinstance(data, list):
+                        data = data[0]
+                    self.assertTrue(data['image_url'].startswith(f'{scheme}://testserver/'), data['image_url'])
+
+    def test_product_change(self):
+        self.warm()
+        self.product.price = '90.00'
+        self.product.save()
+        self.assertIsNone(self.snapshot())
+        for name, data in self.warm().items():
+            with self.subTest(name):
+                self.assertEqual(data['price'], '90.00')
+
+    def test_product_deactivated(self):
+        self.warm()
+        self.product.is_active = False
+        self.product.save()
+        self.assertEqual(self.get(self.list_url)['results'], [])
+        self.assertEqual(self.get(self.featured_url), [])
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+
+    def test_category_change(self):
+        self.warm()
+        self.category.name = 'Desktops'
+        self.category.save()
+        self.assertIsNone(self.snapshot())
+        for name, data in self.warm().items():
+            with self.subTest(name):
+                self.assertEqual(data['category']['name'], 'Desktops')
+
+    def test_specification_change(self):
+        self.warm()
+        ProductSpecification.objects.create(product=self.product, name='Процессор', value='Intel Core i7')
+        self.assertIsNone(self.snapshot())
+        self.assertEqual(self.get(self.detail_url)['specifications'], [
+            {'name': 'Память', 'value': '16GB'},
+            {'name': 'Процессор', 'value': 'Intel Core i7'},
+        ])
+
+    def test_creator_change(self):
+        self.warm()
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertIsNone(self.snapshot())
+        self.assertEqual(self.get(self.detail_url)['created_by']['username'], 'renamed')
+
+    def test_creator_change_detail_validators(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        self.user.username = 'renamed'
+        self.user.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created_by']['username'], 'renamed')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_creator_login(self):
+        self.warm()
+        self.assertTrue(self.client.login(username='owner', password='secret'))
+        self.client.logout()
+        self.assertIsNotNone(self.snapshot())
+        with self.assertNumQueries(0):
+            self.get(self.detail_url)
+
+
+class SparseFieldsetTests(TestCase):
+    """?fields= / ?omit= trim the payload and the SQL behind it."""
+
+    url = '/api/products/products/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        category = Category.objects.create(name='Computers', slug='computers')
+        for i in range(3):
+            Product.objects.create(
+                name=f'Product {i}', slug=f'p{i}', description='Test product', price='100.00',
+                category=category, product_type='computer', brand='Brand', model='M',
+                created_by=cls.user, stock_quantity=i,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def page_query(self, queries):
+        return [q['sql'] for q in queries.captured_queries if ' LIMIT ' in q['sql']][-1]
+
+    def test_fields(self):
+        # A count and the page: category_id for the cache tags is read without extra queries
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'{self.url}?fields=id,name,price')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'name', 'price'})
+        sql = self.page_query(queries)
+        self.assertNotIn('"products_category"', sql)
+        self.assertNotIn('"description"', sql)
+        self.assertIn('"category_id"', sql)
+
+    def test_omit(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'{self.url}?omit=category,image,image_url,image_srcset')
+        row = response.json()['results'][0]
+        self.assertFalse({'category', 'image', 'image_url', 'image_srcset'} & set(row))
+        self.assertEqual(row['is_in_stock'], row['stock_quantity'] > 0)
+        self.assertNotIn('"products_category"', self.page_query(queries))
+
+    def test_all_fields_match_full_payload(self):
+        full = self.client.get(self.url).json()['results']
+        cache.clear()
+        fields = ','.join(full[0])
+        self.assertEqual(self.client.get(f'{self.url}?fields={fields}').json()['results'], full)
+
+    def test_unknown_fields(self):
+        for query in ['fields=id,bogus', 'omit=bogus']:
+            with self.subTest(query=query):
+                response = self.client.get(f'{self.url}?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('bogus', response.json()['error'])
+
+    def test_cursor_keeps_ordering_field(self):
+        url = f'{self.url}?fields=id&cursor=&page_size=2&ordering=price'
+        pages = [self.client.get(url).json()]
+        while pages[-1]['next']:
+            pages.append(self.client.get(pages[-1]['next'].replace('http://testserver', '')).json())
+        walked = [product['id'] for page in pages for product in page['results']]
+        self.assertEqual(walked, list(Product.objects.order_by('price', 'id').values_list('id', flat=True)))
+        self.assertEqual(set(pages[0]['results'][0]), {'id'})
+
+    def test_detail(self):
+        full = self.client.get(f'{self.url}p1/').json()
+        response = self.client.get(f'{self.url}p1/?fields=name,created_by,specifications')
+        self.assertEqual(response.json(), {
+            name: full[name] for name in ('name', 'created_by', 'specifications')
+        })
+        # Inactive products stay visible to their creator only
+        Product.objects.filter(slug='p1').update(is_active=False)
+        cache.clear()
+        self.assertEqual(self.client.get(f'{self.url}p1/?fields=name').status_code, 404)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(f'{self.url}p1/?fields=name').status_code, 200)
+
+
+class ProductBatchTests(TestCase):
+
+    url = '/api/products/products/batch/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        category = Category.objects.create(name='Computers', slug='computers')
+        cls.products = [
+            Product.objects.create(
+                name=f'Product {i}', slug=f'p{i}', description='Test product', price='100.00',
+                category=category, product_type='computer', brand='Brand', model='M',
+                created_by=cls.user, is_active=i != 2,
+            )
+            for i in range(4)
+        ]
+        for product in cls.products:
+            ProductSpecification.objects.create(product=product, name='Память', value='16GB')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, query):
+        return self.client.get(f'{self.url}?{query}')
+
+    def test_slugs_in_request_order(self):
+        # Product, category, creator and specifications in one query
+        with self.assertNumQueries(1):
+            response = self.get('slugs=p3,p0,nope,p2,p0')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([product['slug'] for product in data['results']], ['p3', 'p0'])
+        self.assertEqual(data['missing'], ['nope', 'p2'])
+        self.assertEqual(data['results'][0], self.client.get('/api/products/products/p3/').json())
+
+    def test_ids(self):
+        first, second = self.products[0].id, self.products[1].id
+        data = self.get(f'ids={second}, {first},999').json()
+        self.assertEqual([product['id'] for product in data['results']], [second, first])
+        self.assertEqual(data['missing'], [999])
+
+    def test_invalid_requests(self):
+        for query in ['', 'slugs=', 'slugs=p0&ids=1', 'ids=1,a']:
+            with self.subTest(query=query):
+                self.assertEqual(self.get(query).status_code, 400)
+
+    def test_batch_size_cap(self):
+        self.assertEqual(self.get('ids=' + ','.join(map(str, range(1, 102)))).status_code, 400)
+        data = self.get('ids=' + ','.join(map(str, range(1, 101)))).json()
+        self.assertEqual(len(data['results']) + len(data['missing']), 100)
+
+
+class ProductCompareTests(TestCase):
+
+    url = '/api/products/products/compare/'
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Computers', slug='computers')
+        specs = {
+            'office': [('Процессор', 'Intel Core i5'), ('Память', '16GB')],
+            'gaming': [('Процессор', 'Intel Core i9'), ('Память', '16GB'), ('Видеокарта', 'RTX 4090')],
+            'bare': [],
+        }
+        for slug, rows in specs.items():
+            product = Product.objects.create(
+                name=slug, slug=slug, description='Test product', price='100.00', category=category,
+                product_type='computer', brand='Brand', model='M',
+            )
+            for name, value in rows:
+                ProductSpecification.objects.create(product=product, name=name, value=value)
+        Product.objects.create(
+            name='hidden', slug='hidden', description='Test product', price='100.00', category=category,
+            product_type='computer', brand='Brand', model='M', is_active=False,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_matrix(self):
+        data = self.client.get(f'{self.url}?slugs=gaming,nope,office,bare,hidden').json()
+        self.assertEqual([product['slug'] for product in data['products']], ['gaming', 'office', 'bare'])
+        self.assertEqual(data['missing'], ['nope', 'hidden'])
+        self.assertEqual(data['specifications'], [
+            {'name': 'Процессор', 'values': ['Intel Core i9', 'Intel Core i5', None], 'differs': True},
+            {'name': 'Память', 'values': ['16GB', '16GB', None], 'differs': True},
+            {'name': 'Видеокарта', 'values': ['RTX 4090', None, None], 'differs': True},
+        ])
+
+    def test_same_values(self):
+        data = self.client.get(f'{self.url}?slugs=office,office').json()
+        self.assertEqual(len(data['products']), 1)
+        self.assertFalse(any(row['differs'] for row in data['specifications']))
+
+    def test_limits(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        slugs = ','.join(f'p{i}' for i in range(7))
+        self.assertEqual(self.client.get(f'{self.url}?slugs={slugs}').status_code, 400)
+        slugs = ','.join(f'p{i}' for i in range(6))
+        self.assertEqual(self.client.get(f'{self.url}?slugs={slugs}').json()['missing'], slugs.split(','))
+
+    def test_cache_ignores_slug_order(self):
+        self.client.get(f'{self.url}?slugs=office,gaming')
+        with self.assertNumQueries(0):
+            data = self.client.get(f'{self.url}?slugs=gaming,office').json()
+        self.assertEqual([product['slug'] for product in data['products']], ['gaming', 'office'])
+        self.assertEqual(data['specifications'][0]['values'], ['Intel Core i9', 'Intel Core i5'])
+
+    def test_specification_change(self):
+        self.client.get(f'{self.url}?slugs=office,gaming')
+        spec = ProductSpecification.objects.get(product__slug='office', name='Память')
+        spec.value = '32GB'
+        spec.save()
+        data = self.client.get(f'{self.url}?slugs=office,gaming').json()
+        self.assertEqual(data['specifications'][1]['values'], ['32GB', '16GB'])
+
+
+class DerivedFieldsTests(TestCase):
+    """Saving a stale instance never writes back Product.specs or image_variants."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Computers', slug='computers')
+        cls.product = Product.objects.create(
+            name='PC', slug='pc', description='Test product', price='100.00', category=cls.category,
+            product_type='computer', brand='Brand', model='M',
+        )
+
+    def test_stale_product_save(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        ProductSpecification.objects.create(product_id=self.product.pk, name='Память', value='16GB')
+        variants = {'source': 'products/pc.png', 'formats': {}}
+        Product.objects.filter(pk=self.product.pk).update(image_variants=variants)
+
+        stale.price = '90.00'
+        stale.save()
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.price, Decimal('90.00'))
+        self.assertEqual(product.specs, [{'name': 'Память', 'value': '16GB'}])
+        self.assertEqual(product.image_variants, variants)
+
+    def test_stale_category_save(self):
+        stale = Category.objects.get(pk=self.category.pk)
+        variants = {'source': 'categories/c.png', 'formats': {}}
+        Category.objects.filter(pk=self.category.pk).update(image_variants=variants)
+        stale.name = 'Desktops'
+        stale.save()
+        category = Category.objects.get(pk=self.category.pk)
+        self.assertEqual((category.name, category.image_variants), ('Desktops', variants))
+
+    def test_deferred_fields_left_out(self):
+        product = Product.objects.only('pk', 'price').get(pk=self.product.pk)
+        product.price = '80.00'
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertRegex(updates[0], r'^UPDATE "products_product" SET "price" = \S+ WHERE')
+
+
+class ProductListConditionalTests(TestCase):
+    """List validators come from the cache tag versions, not from the products table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Computers', slug='computers')
+        cls.product = Product.objects.create(
+            name='PC', slug='pc', description='Test product', price='100.00', category=cls.category,
+            product_type='computer', brand='Brand', model='M',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_etag_without_aggregate(self):
+        for url in ['/api/products/products/', '/api/products/products/?cursor=&page_size=5']:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertTrue(response.has_header('ETag'))
+                self.assertFalse([q['sql'] for q in queries.captured_queries if 'MAX(' in q['sql']])
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_products_and_categories(self):
+        url = '/api/products/products/'
+        etag = self.client.get(url)['ETag']
+        self.product.price = '90.00'
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['price'], '90.00')
+
+        etag = response['ETag']
+        self.category.name = 'Desktops'
+        self.category.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['category']['name'], 'Desktops')
+
+
+def png(color, size=(400, 300)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(IMAGE_DERIVATIVES_BACKGROUND=False)
+class ContentAddressedStorageTests(TestCase):
+    """Identical uploads share one file, which is swept once nothing references it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Computers', slug='computers')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def create_product(self, slug, data, filename='photo.png'):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                name=slug, slug=slug, description='Test product', price='100.00', category=self.category,
+                product_type='computer', brand='Brand', model='M', image=SimpleUploadedFile(filename, data),
+            )
+        product.refresh_from_db()
+        return product
+
+    def names(self, product):
+        variants = product.image_variants['formats'].values()
+        return {product.image.name, *(name for sizes in variants for name in sizes.values())}
+
+    def stored(self):
+        storage = Product._meta.get_field('image').storage
+        return {
+            os.path.relpath(os.path.join(directory, name), storage.location)
+            for directory, _, filenames in os.walk(storage.location) for name in filenames
+        }
+
+    def collect(self):
+        return Product._meta.get_field('image').storage.collect_garbage(grace=0)
+
+    def test_identical_uploads_stored_once(self):
+        first = self.create_product('first', png((1, 2, 3)), 'one.png')
+        second = self.create_product('second', png((1, 2, 3)), 'two.PNG')
+        self.assertTrue(first.image.name.startswith('cas/'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image_variants, second.image_variants)
+        # The original and one 320w derivative per format
+        self.assertEqual(self.stored(), self.names(first))
+        self.assertEqual(len(self.stored()), 3)
+
+    def test_shared_files_kept(self):
+        first = self.create_product('first', png((1, 2, 3)))
+        second = self.create_product('second', png((1, 2, 3)))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        # delete() itself never removes a content-addressed file
+        first.image.storage.delete(first.image.name)
+        self.assertEqual(self.collect(), [])
+        self.assertEqual(self.stored(), self.names(first))
+
+    def test_replaced_image_released(self):
+        product = self.create_product('first', png((1, 2, 3)))
+        old = self.names(product)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = SimpleUploadedFile('new.png', png((9, 9, 9)))
+            product.save()
+        product.refresh_from_db()
+        self.assertEqual(self.collect(), sorted(old))
+        self.assertEqual(self.stored(), self.names(product))
+
+    def test_recent_files_kept(self):
+        storage = Product._meta.get_field('image').storage
+        name = storage.save('orphan.png', SimpleUploadedFile('orphan.png', png((5, 5, 5))))
+        # Possibly referenced by a transaction that has not committed yet
+        self.assertEqual(storage.collect_garbage(), [])
+        self.assertEqual(self.collect(), [name])
+
+    def test_immutable_cache_header(self):
+        product = self.create_product('first', png((1, 2, 3)))
+        response = content_addressed_media(RequestFactory().get('/'), product.image.name[len('cas/'):])
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+
+@override_settings(IMAGE_DERIVATIVES_BACKGROUND=False)
+class ImageDerivativeTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def test_missing_source_recorded_once(self):
+        with self.assertLogs('products.images', 'WARNING') as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                category = Category.objects.create(name='Computers', slug='computers', image='categories/gone.png')
+        self.assertEqual(len(logs.records), 1)
+        category.refresh_from_db()
+        self.assertEqual(category.image_variants, {'source': 'categories/gone.png', 'formats': {}, 'missing': True})
+
+        # Not retried by later saves of the same image
+        with self.assertNoLogs('products.images'):
+            with self.captureOnCommitCallbacks(execute=True):
+                category.name = 'Desktops'
+                category.save()
+
+        data = APIClient().get('/api/products/products/categories/').json()
+        self.assertIsNone(data[0]['image_srcset'])
@@ -6,6 +6,9 @@ urlpatterns = [
     # Более специфичные пути должны идти перед общими
     path('products/featured/', views.featured_products, name='featured-products'),
     path('products/categories/', views.product_categories, name='product-categories'),
+    path('products/facets/', views.ProductFacetsView.as_view(), name='product-facets'),
+    path('products/compare/', views.ProductCompareView.as_view(), name='product-compare'),
+    path('products/batch/', views.ProductBatchView.as_view(), name='product-batch'),
     path('products/create/', views.ProductCreateView.as_view(), name='product-create'),
     path('products/<slug:slug>/update/', views.ProductUpdateView.as_view(), name='product-update'),
     path('products/<slug:slug>/delete/', views.ProductDeleteView.as_view(), name='product-delete'),
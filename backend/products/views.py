@@ -1,50 +1,262 @@
-from rest_framework import generics, filters, status
+from datetime import datetime, timezone
+
+from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied, NotFound
+from rest_framework.exceptions import PermissionDenied, NotFound, ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
+from django.db.models import Count, F, Q
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
+from django.views.static import serve
 from .models import Category, Product
 from .serializers import CategorySerializer, ProductSerializer, ProductListSerializer, ProductCreateSerializer, ProductUpdateSerializer
 from .pagination import ProductPagination
+from .search import ProductSearchFilter, ProductOrderingFilter
+from .filters import ProductFilter
+from .facets import compute_facets
+from .compare import spec_matrix
+from .images import image_srcset
+from .cache import (
+    CachedResponseMixin, cached_response, add_cache_tags, get_tagged, set_tagged, tag_versions,
+    product_snapshot_key, product_compare_key, product_tag, category_tag, user_tag, PRODUCTS_TAG, CATEGORIES_TAG,
+)
+from .conditional import ConditionalGetMixin, fingerprint
+from .fieldsets import SparseFieldsetMixin
+from .storage import CONTENT_DIR
+from .streaming import StreamingListMixin
+
+
+def product_detail_tags(product):
+    """Cache tags of a serialized ProductSerializer representation."""
+    tags = [product_tag(product.id), category_tag(product.category_id)]
+    if product.created_by_id is not None:
+        tags.append(user_tag(product.created_by_id))
+    return tags
 
 
-class CategoryListView(generics.ListAPIView):
+class CategoryListView(CachedResponseMixin, generics.ListAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cache_tags = [CATEGORIES_TAG]
 
 
-class ProductListView(generics.ListAPIView):
-    queryset = Product.objects.filter(is_active=True)
+class ProductListView(
+    CachedResponseMixin, ConditionalGetMixin, SparseFieldsetMixin, StreamingListMixin, generics.ListAPIView
+):
+    queryset = Product.objects.filter(is_active=True).select_related('category')
     serializer_class = ProductListSerializer
     pagination_class = ProductPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['category', 'product_type', 'brand']
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, ProductOrderingFilter]
+    filterset_class = ProductFilter
     search_fields = ['name', 'description', 'brand', 'model']
     ordering_fields = ['price', 'created_at', 'name']
     ordering = ['-created_at']
+    cache_tags = [PRODUCTS_TAG]
 
+    def get_required_fields(self):
+        # Cache tags read category_id, cursor pagination the ordering value
+        return ['category', *self.ordering_fields]
 
-class ProductDetailView(generics.RetrieveAPIView):
-    queryset = Product.objects.all()
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            add_cache_tags(self.request, *{category_tag(p.category_id) for p in page})
+        return page
+
+    def get_validators(self, request, *args, **kwargs):
+        # Every product and category write bumps one of these tags (see
+        # products.signals), so their versions stand for the state of any
+        # page without querying it. Versions are time.time_ns() stamps
+        versions = tag_versions([PRODUCTS_TAG, CATEGORIES_TAG])
+        etag = fingerprint(
+            versions[PRODUCTS_TAG], versions[CATEGORIES_TAG],
+            sorted(request.query_params.lists()), request.accepted_media_type,
+        )
+        last_modified = datetime.fromtimestamp(max(versions.values()) / 1e9, tz=timezone.utc)
+        return etag, last_modified
+
+
+class ProductDetailView(CachedResponseMixin, ConditionalGetMixin, SparseFieldsetMixin, generics.RetrieveAPIView):
+    # Product, category, creator and specifications (Product.specs) in one query
+    queryset = Product.objects.select_related('category', 'created_by')
     serializer_class = ProductSerializer
     lookup_field = 'slug'
+
+    def get_validators(self, request, *args, **kwargs):
+        # Specification changes touch Product.updated_at (see products.signals)
+        row = Product.objects.filter(slug=kwargs['slug']).values(
+            'id', 'updated_at', 'is_active', 'created_by_id', 'created_by__username', 'category__updated_at'
+        ).first()
+        if row is None:
+            return None, None
+        if not row['is_active'] and not (
+            request.user.is_authenticated and row['created_by_id'] == request.user.pk
+        ):
+            return None, None
+        etag = fingerprint(
+            row['id'], row['updated_at'].isoformat(), row['category__updated_at'].isoformat(),
+            row['created_by__username'], request.accepted_media_type,
+        )
+        last_modified = max(row['updated_at'], row['category__updated_at'])
+        if row['created_by_id'] is not None:
+            # Users have no modification time: a rename bumps their tag (time.time_ns())
+            version = tag_versions([user_tag(row['created_by_id'])])[user_tag(row['created_by_id'])]
+            last_modified = max(last_modified, datetime.fromtimestamp(version / 1e9, tz=timezone.utc))
+        return etag, last_modified
+
+    def get_required_fields(self):
+        return ['category', 'created_by', 'is_active']
     
     def get_object(self):
-        obj = get_object_or_404(Product, slug=self.kwargs['slug'])
+        obj = get_object_or_404(self.get_queryset(), slug=self.kwargs['slug'])
         # If user is authenticated and is the creator, allow access even if inactive
         # Otherwise, only allow access to active products
         if (self.request.user.is_authenticated and 
-            obj.created_by and 
-            obj.created_by == self.request.user):
+            obj.created_by_id is not None and 
+            obj.created_by_id == self.request.user.id):
             return obj
         if not obj.is_active:
             raise NotFound("Товар не найден.")
+        # Only active products are public, so only they are cached
+        add_cache_tags(self.request, *self.get_snapshot_tags(obj))
         return obj
 
+    def get_snapshot_tags(self, obj):
+        return product_detail_tags(obj)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Snapshots hold the full representation only
+        if not settings.PRODUCT_DETAIL_SNAPSHOTS or self.get_sparse_fieldset():
+            return super().retrieve(request, *args, **kwargs)
+
+        key = product_snapshot_key(request, self.kwargs['slug'])
+        snapshot = get_tagged(key)
+        if snapshot is not None:
+            add_cache_tags(request, *snapshot['tags'])
+            return Response(snapshot['data'])
+
+        instance = self.get_object()
+        data = self.get_serializer(instance).data
+        if instance.is_active:
+            tags = self.get_snapshot_tags(instance)
+            set_tagged(key, {'data': data, 'tags': tags}, tags)
+        return Response(data)
+
+
+class ProductFacetsView(CachedResponseMixin, generics.ListAPIView):
+    """
+    Filter sidebar counts per category, product type, brand and price range.
+
+    Takes the same filters and ``?search=`` as the product list; responses
+    are cached per filter combination.
+    """
+    queryset = Product.objects.filter(is_active=True)
+    filter_backends = [ProductSearchFilter]
+    search_fields = ProductListView.search_fields
+    cache_tags = [PRODUCTS_TAG, CATEGORIES_TAG]
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(compute_facets(queryset, request.query_params, request))
+
+
+class ProductBatchView(CachedResponseMixin, SparseFieldsetMixin, generics.ListAPIView):
+    """
+    Get many active products at once: ``?slugs=a,b,c`` or ``?ids=1,2,3``.
+
+    Results keep the request order; lookups that match no active product
+    are listed under ``missing``.
+    """
+    queryset = Product.objects.filter(is_active=True).select_related('category', 'created_by')
+    serializer_class = ProductSerializer
+    max_batch_size = 100
+    cache_tags = [PRODUCTS_TAG]
+
+    def get_lookups(self):
+        slugs = self.request.query_params.get('slugs')
+        ids = self.request.query_params.get('ids')
+        if bool(slugs) == bool(ids):
+            raise ValidationError({'error': "Укажите либо slugs, либо ids."})
+        field, raw = ('slug', slugs) if slugs else ('id', ids)
+        values = list(dict.fromkeys(value.strip() for value in raw.split(',') if value.strip()))
+        if field == 'id':
+            try:
+                values = list(dict.fromkeys(int(value) for value in values))
+            except ValueError:
+                raise ValidationError({'error': "ids должны быть целыми числами."})
+        if len(values) > self.max_batch_size:
+            raise ValidationError({'error': f"Не более {self.max_batch_size} товаров за запрос."})
+        return field, values
+
+    def get_required_fields(self):
+        return ['slug', 'category', 'created_by']
+
+    def list(self, request, *args, **kwargs):
+        field, values = self.get_lookups()
+        products = {
+            getattr(product, field): product
+            for product in self.get_queryset().filter(**{f'{field}__in': values}).order_by()
+        } if values else {}
+        found = [products[value] for value in values if value in products]
+
+        add_cache_tags(request, *{tag for product in found for tag in product_detail_tags(product)})
+        return Response({
+            'results': self.get_serializer(found, many=True).data,
+            'missing': [value for value in values if value not in products],
+        })
+
+
+class ProductCompareView(generics.GenericAPIView):
+    """
+    Compare active products side by side: ``?slugs=a,b,c``.
+
+    Returns the products in request order and one row per specification
+    name found on any of them, with values aligned to ``products``. The
+    data is cached per set of slugs, so reordering them is a cache hit.
+    """
+    queryset = Product.objects.filter(is_active=True).select_related('category')
+    serializer_class = ProductListSerializer
+    max_compare_size = 6
+
+    def get_slugs(self):
+        raw = self.request.query_params.get('slugs', '')
+        slugs = list(dict.fromkeys(slug.strip() for slug in raw.split(',') if slug.strip()))
+        if not slugs:
+            raise ValidationError({'error': "Укажите slugs товаров для сравнения."})
+        if len(slugs) > self.max_compare_size:
+            raise ValidationError({'error': f"Можно сравнить не более {self.max_compare_size} товаров."})
+        return slugs
+
+    def get(self, request, *args, **kwargs):
+        slugs = self.get_slugs()
+        key = product_compare_key(request, slugs)
+        entry = get_tagged(key)
+        if entry is None:
+            # Specifications come with the rows (Product.specs): one query in all
+            products = list(self.get_queryset().filter(slug__in=slugs).order_by())
+            cards = self.get_serializer(products, many=True).data
+            entry = {
+                product.slug: {'product': card, 'specs': product.specs}
+                for product, card in zip(products, cards)
+            }
+            tags = {PRODUCTS_TAG}
+            for product in products:
+                tags.update([product_tag(product.id), category_tag(product.category_id)])
+            set_tagged(key, entry, tags)
+
+        found = [slug for slug in slugs if slug in entry]
+        return Response({
+            'products': [entry[slug]['product'] for slug in found],
+            'specifications': spec_matrix([entry[slug]['specs'] for slug in found]),
+            'missing': [slug for slug in slugs if slug not in entry],
+        })
+
 
 @api_view(['GET'])
+@cached_response
 def featured_products(request):
     """Get featured products (computers, all-in-one, laptops)"""
     # Get categories for computers, all-in-one, and laptops
@@ -57,7 +269,7 @@ def featured_products(request):
         is_active=True,
         product_type__in=['computer', 'all-in-one'],
         category__in=computer_categories
-    ).order_by('-created_at')
+    ).select_related('category').order_by('-created_at')
     
     products = list(products_queryset[:8])
     product_ids = [p.id for p in products]
@@ -68,26 +280,40 @@ def featured_products(request):
             is_active=True
         ).exclude(
             id__in=product_ids
-        ).order_by('-created_at')[:8 - len(products)]
+        ).select_related('category').order_by('-created_at')[:8 - len(products)]
         products.extend(list(additional_products))
     
+    add_cache_tags(request, PRODUCTS_TAG, *{category_tag(p.category_id) for p in products})
     serializer = ProductListSerializer(products, many=True, context={'request': request})
     return Response(serializer.data)
 
 
 @api_view(['GET'])
+@cached_response
 def product_categories(request):
     """Get all categories with product counts"""
-    categories = Category.objects.all()
+    add_cache_tags(request, CATEGORIES_TAG, PRODUCTS_TAG)
+    if settings.PRODUCT_CATEGORY_COUNTERS:
+        # Counters kept up to date by products.signals, no aggregation needed
+        categories = Category.objects.annotate(
+            product_count=Coalesce(F('product_count_row__active_products'), 0)
+        )
+    else:
+        categories = Category.objects.annotate(
+            product_count=Count('products', filter=Q(products__is_active=True))
+        )
     data = []
     for category in categories:
-        product_count = category.products.filter(is_active=True).count()
         data.append({
             'id': category.id,
             'name': category.name,
             'slug': category.slug,
-            'product_count': product_count,
-            'image': request.build_absolute_uri(category.image.url) if category.image else None
+            'product_count': category.product_count,
+            'image': request.build_absolute_uri(category.image.url) if category.image else None,
+            'image_srcset': image_srcset(
+                category.image, category.image_variants,
+                lambda name: request.build_absolute_uri(category.image.storage.url(name)),
+            ),
         })
     return Response(data)
 
@@ -133,4 +359,11 @@ class ProductDeleteView(generics.DestroyAPIView):
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         self.perform_destroy(instance)
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def content_addressed_media(request, path):
+    """Serve a file of the content-addressed storage; its name changes with its bytes."""
+    response = serve(request, f'{CONTENT_DIR}/{path}', document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
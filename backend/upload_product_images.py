@@ -3,9 +3,15 @@
 Скрипт для загрузки изображений товаров
 Поместите изображения в папку backend/product_images/
 Имена файлов должны соответствовать slug товаров
+Загружаются только новые и изменившиеся изображения (сравнение по хешу),
+--dry-run показывает, что будет сделано, ничего не меняя
 """
+import argparse
+import hashlib
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
 import django
 
 # Add the project directory to Python path
@@ -16,16 +22,77 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 django.setup()
 
 from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from products.cache import invalidate_cache_tags, product_tag, PRODUCTS_TAG
+from products.images import schedule_derivatives
 from products.models import Product
 
-def upload_product_images():
+# Расширения в порядке приоритета, если для товара есть несколько файлов
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.webp']
+
+
+def scan_images(images_dir):
+    """Один проход по папке: slug -> путь к изображению"""
+    found = {}
+    for entry in os.scandir(images_dir):
+        slug, ext = os.path.splitext(entry.name)
+        ext = ext.lower()
+        if ext not in IMAGE_EXTENSIONS or not entry.is_file():
+            continue
+        current = found.get(slug)
+        if current is None or IMAGE_EXTENSIONS.index(ext) < IMAGE_EXTENSIONS.index(current[1]):
+            found[slug] = (entry.path, ext)
+    return {slug: path for slug, (path, _) in found.items()}
+
+
+def file_digest(f):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_unchanged(product, image_path):
+    """Совпадает ли сохранённое изображение товара с файлом побайтно"""
+    if not product.image:
+        return False
+    storage = product.image.storage
+    try:
+        # Разный размер - файл точно изменился, хешировать не нужно
+        if storage.size(product.image.name) != os.path.getsize(image_path):
+            return False
+        with storage.open(product.image.name, 'rb') as stored:
+            stored_digest = file_digest(stored)
+    except OSError:
+        return False
+    with open(image_path, 'rb') as f:
+        return file_digest(f) == stored_digest
+
+
+def import_image(product, image_path, dry_run):
+    """Возвращает (статус, новое имя файла в хранилище или None)"""
+    if is_unchanged(product, image_path):
+        return 'unchanged', None
+    status = 'updated' if product.image else 'new'
+    if dry_run:
+        return status, None
+    field = product.image.field
+    # Новый файл сохраняется рядом со старым, старый удаляется после bulk_update
+    name = field.generate_filename(product, os.path.basename(image_path))
+    with open(image_path, 'rb') as f:
+        return status, field.storage.save(name, File(f), max_length=field.max_length)
+
+
+def upload_product_images(dry_run=False, workers=8, all_types=False):
     """
     Загружает изображения для товаров из папки product_images/
     Имена файлов должны соответствовать slug товаров
     """
     # Путь к папке с изображениями
     images_dir = os.path.join(os.path.dirname(__file__), 'product_images')
-    
+
     if not os.path.exists(images_dir):
         print(f"Sozdayu papku {images_dir}")
         os.makedirs(images_dir)
@@ -36,54 +103,71 @@ def upload_product_images():
         print("  - apple-imac-24-m3.png")
         print("  - i t.d.")
         return
-    
-    # Получаем все товары без изображений или обновляем существующие
-    products = Product.objects.filter(product_type='computer')
-    
-    uploaded = 0
-    not_found = []
-    
-    for product in products:
-        # Ищем изображение с разными расширениями
-        image_extensions = ['.png', '.jpg', '.jpeg', '.webp']
-        image_path = None
-        
-        for ext in image_extensions:
-            potential_path = os.path.join(images_dir, f"{product.slug}{ext}")
-            if os.path.exists(potential_path):
-                image_path = potential_path
-                break
-        
-        if image_path:
+
+    images = scan_images(images_dir)
+    products = Product.objects.all() if all_types else Product.objects.filter(product_type='computer')
+    products = list(products.only('pk', 'slug', 'name', 'image'))
+
+    not_found = [product.slug for product in products if product.slug not in images]
+    candidates = [product for product in products if product.slug in images]
+
+    counts = {'new': 0, 'updated': 0, 'unchanged': 0, 'error': 0}
+    changed = []
+    old_names = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (product, executor.submit(import_image, product, images[product.slug], dry_run))
+            for product in candidates
+        ]
+        for product, future in futures:
             try:
-                with open(image_path, 'rb') as f:
-                    # Удаляем старое изображение если есть
-                    if product.image:
-                        try:
-                            os.remove(product.image.path)
-                        except:
-                            pass
-                    
-                    # Сохраняем новое изображение
-                    product.image.save(
-                        os.path.basename(image_path),
-                        File(f),
-                        save=True
-                    )
-                print(f"[OK] Zagruzheno izobrazhenie dlya: {product.name}")
-                uploaded += 1
+                status, name = future.result()
             except Exception as e:
                 print(f"[ERROR] Oshibka pri zagruzke {product.name}: {e}")
-        else:
-            not_found.append(product.slug)
-    
-    print(f"\nZagruzheno izobrazheniy: {uploaded}")
+                counts['error'] += 1
+                continue
+            counts[status] += 1
+            if status == 'unchanged':
+                continue
+            prefix = '[DRY-RUN] ' if dry_run else '[OK] '
+            print(f"{prefix}{'Novoe' if status == 'new' else 'Obnovleno'} izobrazhenie dlya: {product.name}")
+            if not dry_run:
+                if product.image:
+                    old_names.append(product.image.name)
+                product.image.name = name
+                product.updated_at = timezone.now()
+                changed.append(product)
+
+    if changed:
+        with transaction.atomic():
+            Product.objects.bulk_update(changed, ['image', 'updated_at'], batch_size=500)
+        # Файлы со старыми именами удаляются сразу, общие файлы cas/ - collect_media_garbage.py
+        storage = Product._meta.get_field('image').storage
+        new_names = {product.image.name for product in changed}
+        for name in old_names:
+            if name not in new_names:
+                storage.delete(name)
+        # bulk_update не вызывает сигналы: кэш и уменьшенные копии обновляем сами
+        invalidate_cache_tags(PRODUCTS_TAG, *(product_tag(product.pk) for product in changed))
+        for product in changed:
+            schedule_derivatives(product, [product_tag(product.pk), PRODUCTS_TAG])
+
+    if dry_run:
+        print("\n[DRY-RUN] Nichego ne izmeneno")
+    print(f"\nNovyh: {counts['new']}, obnovleno: {counts['updated']}, "
+          f"bez izmeneniy: {counts['unchanged']}, oshibok: {counts['error']}")
     if not_found:
         print(f"\nNe naydeny izobrazheniya dlya sleduyushchih tovarov:")
         for slug in not_found:
             print(f"  - {slug}.png (ili .jpg, .jpeg, .webp)")
         print(f"\nPomestite izobrazheniya v papku: {images_dir}")
 
-if __name__ == '__main__':
-    upload_product_images()
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+    parser.add_argument('--workers', type=int, default=8, help='Parallel file copies')
+    parser.add_argument('--all-types', action='store_true',
+                        help='Import images for every product, not only computers')
+    args = parser.parse_args()
+    upload_product_images(dry_run=args.dry_run, workers=args.workers, all_types=args.all_types)
@@ -1,19 +1,55 @@
 'use client';
 
-import { useMemo, useState } from 'react';
+import { useEffect, useMemo, useState } from 'react';
 import Image from "next/image";
 import Link from "next/link";
 import { ShoppingCart, Trash2, Plus, Minus, CreditCard } from 'lucide-react';
 import Footer from '../../components/Footer';
 import { useCart } from '@/context/CartContext';
 import { isAuthenticated } from '@/utils/auth';
+import { quoteCart } from '@/utils/api';
 import AuthRequiredModal from '../../components/modals/AuthRequiredModal';
 
 export default function CartPage() {
   const [loading, setLoading] = useState(false);
   const { cart, updateQuantity, removeFromCart, clearCart, totalItems, totalPrice } = useCart();
   const [showAuthModal, setShowAuthModal] = useState(false);
-  const formattedTotalPrice = useMemo(() => totalPrice.toLocaleString(), [totalPrice]);
+  const [quote, setQuote] = useState(null);
+
+  // Актуальные цены и наличие всей корзины одним запросом при каждом изменении
+  const quoteKey = cart.map((item) => `${item.id}:${item.quantity}`).join(',');
+  useEffect(() => {
+    if (cart.length === 0) {
+      setQuote(null);
+      return;
+    }
+    let cancelled = false;
+    quoteCart(cart)
+      .then((data) => {
+        if (!cancelled) setQuote(data);
+      })
+      .catch(() => {
+        // Без ответа сервера показываем цены из корзины
+        if (!cancelled) setQuote(null);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [quoteKey]);
+
+  const quotedLines = useMemo(
+    () => new Map((quote?.items ?? []).map((line) => [line.product_id, line])),
+    [quote],
+  );
+  const unitPrice = (item) => {
+    const line = quotedLines.get(item.id);
+    return line ? Number(line.unit_price) : item.unitPrice;
+  };
+  const formattedTotalPrice = useMemo(
+    () => (quote ? Number(quote.total_amount) : totalPrice).toLocaleString(),
+    [quote, totalPrice],
+  );
+  const unavailable = quote !== null && !quote.available;
 
   const proceedToCheckout = () => {
     // Check if user is authenticated
@@ -95,7 +131,7 @@ export default function CartPage() {
                       <p className="text-slate-400 text-xs sm:text-sm mb-2">{item.brand}</p>
                       <div className="flex items-center justify-between mb-2 sm:mb-0">
                         <span className="text-lg sm:text-xl font-bold text-blue-400">
-                          {item.price}
+                          {unitPrice(item).toLocaleString()} USD
                         </span>
                         <div className="flex items-center space-x-2">
                           <button
@@ -113,6 +149,14 @@ export default function CartPage() {
                           </button>
                         </div>
                       </div>
+                      {quote?.missing.includes(item.id) && (
+                        <p className="text-red-400 text-xs sm:text-sm">Товар больше не продаётся</p>
+                      )}
+                      {quotedLines.get(item.id)?.available === false && (
+                        <p className="text-red-400 text-xs sm:text-sm">
+                          Недостаточно на складе (в наличии: {quotedLines.get(item.id).stock_quantity})
+                        </p>
+                      )}
                     </div>
                     
                     <div className="flex flex-row sm:flex-col items-center sm:items-end justify-between sm:justify-start w-full sm:w-auto space-x-2 sm:space-x-0 sm:space-y-2">
@@ -123,7 +167,7 @@ export default function CartPage() {
                         <Trash2 className="h-4 w-4" />
                       </button>
                       <span className="text-base sm:text-lg font-semibold">
-                        {(item.unitPrice * item.quantity).toLocaleString()} USD
+                        {(unitPrice(item) * item.quantity).toLocaleString()} USD
                       </span>
                     </div>
                   </div>
@@ -171,7 +215,7 @@ export default function CartPage() {
 
               <button
                 onClick={proceedToCheckout}
-                disabled={loading}
+                disabled={loading || unavailable}
                 className="w-full bg-blue-600 hover:bg-blue-700 disabled:bg-slate-600 text-white py-2.5 sm:py-3 px-3 sm:px-4 rounded-lg font-semibold transition-colors flex items-center justify-center text-sm sm:text-base"
               >
                 <CreditCard className="h-4 w-4 sm:h-5 sm:w-5 mr-2" />
@@ -46,6 +46,7 @@ export default function CheckoutPage() {
       
       // Prepare items for order
       const orderItems = cartItems.map((item) => ({
+        product_id: item.id,
         product_name: `${item.brand} ${item.name}`,
         product_price: item.price,
         quantity: item.quantity,
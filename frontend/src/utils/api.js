@@ -170,4 +170,16 @@ export const deleteProduct = async (slug) => {
   }
 };
 
+// Актуальные цены, наличие и сумма корзины одним запросом
+export const quoteCart = async (cartItems) => {
+  try {
+    const items = cartItems.map((item) => ({ product_id: item.id, quantity: item.quantity }));
+    const response = await api.post('/api/orders/quote/', { items });
+    return response.data;
+  } catch (error) {
+    console.error('Error quoting cart:', error.response ? error.response.data : error.message);
+    throw error.response ? error.response.data : new Error('Failed to quote cart');
+  }
+};
+
 export default api;